@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# The scripts import each other by bare module name
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "updater"))
@@ -0,0 +1,127 @@
+import asyncio
+import pathlib
+import socket
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from breaker import FAILURE_THRESHOLD, PROBE_INTERVAL, CircuitBreaker
+from downloadLib import wget
+from stateDb import StateDb
+
+HOST = "example.org"
+DOWN = ConnectionError("refused")
+
+
+@pytest.fixture
+def db(tmp_path: pathlib.Path) -> StateDb:
+    return StateDb(tmp_path)
+
+
+def run(db: StateDb, *errors: BaseException | None) -> CircuitBreaker:
+    """One downloader run recording the given outcomes for HOST."""
+    breaker = CircuitBreaker(db, "url")
+    for error in errors:
+        if breaker.allow(HOST):
+            breaker.record(HOST, error)
+    return breaker
+
+
+def test_host_trips_after_threshold_runs(db: StateDb) -> None:
+    for _ in range(FAILURE_THRESHOLD - 1):
+        run(db, DOWN, DOWN, DOWN)
+    assert db.host(HOST)["failures"] == FAILURE_THRESHOLD - 1
+
+    run(db, DOWN)
+    entry = db.host(HOST)
+    assert entry["failures"] == FAILURE_THRESHOLD
+    assert entry["retry"] == pytest.approx(time.time() + PROBE_INTERVAL, abs=5)
+    assert not CircuitBreaker(db, "url").allow(HOST)
+
+
+def test_failure_wins_over_success_in_a_run(db: StateDb) -> None:
+    run(db, DOWN)
+    run(db, None, DOWN, None)
+
+    assert db.host(HOST)["failures"] == 2
+
+
+def test_success_clears_the_host(db: StateDb) -> None:
+    run(db, DOWN)
+    run(db, None)
+
+    assert db.host(HOST) is None
+
+
+def test_each_failed_probe_doubles_the_wait(db: StateDb) -> None:
+    db.setHost(HOST, FAILURE_THRESHOLD, 0)
+    run(db, DOWN, DOWN)
+    entry = db.host(HOST)
+    assert entry["failures"] == FAILURE_THRESHOLD + 1
+    assert entry["retry"] == pytest.approx(time.time() + 2 * PROBE_INTERVAL, abs=5)
+
+    db.setHost(HOST, entry["failures"], 0)
+    run(db, DOWN)
+    assert db.host(HOST)["retry"] == pytest.approx(
+        time.time() + 4 * PROBE_INTERVAL, abs=5
+    )
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        status = int(self.path.strip("/").partition(".")[0])
+        self.send_response(status)
+        self.send_header("Content-Length", "3")
+        self.end_headers()
+        self.wfile.write(b"jar")
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def closedPort() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize(
+    ("path", "ok", "failures"),
+    [("200.jar", True, None), ("404.jar", False, None), ("503.jar", False, 1)],
+)
+def test_wget_charges_only_server_errors(
+    db: StateDb,
+    server: str,
+    tmp_path: pathlib.Path,
+    path: str,
+    ok: bool,
+    failures: int | None,
+) -> None:
+    breaker = CircuitBreaker(db, "url")
+    assert (
+        asyncio.run(wget(f"http://{server}/{path}", tmp_path, "test", "url", breaker))
+        is ok
+    )
+
+    entry = db.host(server)
+    assert (entry and entry["failures"]) == failures
+
+
+def test_wget_charges_refused_connections(db: StateDb, tmp_path: pathlib.Path) -> None:
+    host = f"127.0.0.1:{closedPort()}"
+    breaker = CircuitBreaker(db, "url")
+
+    assert not asyncio.run(
+        wget(f"http://{host}/a.jar", tmp_path, "test", "url", breaker)
+    )
+    assert db.host(host)["failures"] == 1
@@ -0,0 +1,65 @@
+import pathlib
+
+from depGraph import affectedBy, buildGraph, groupUpdates
+from index_plugins import no_dependencies
+from plLib import PluginItem, pluginItem
+
+
+def plugin(
+    name: str, depend: tuple[str, ...] = (), loadbefore: tuple[str, ...] = ()
+) -> PluginItem:
+    deps = no_dependencies(name)
+    deps["depend"] = frozenset(depend)
+    deps["loadbefore"] = frozenset(loadbefore)
+    return pluginItem(pathlib.PosixPath(f"{name}.jar"), name.lower(), "1.0", deps)
+
+
+def database(*plugins: PluginItem) -> dict[str, PluginItem]:
+    return {pli["artifact"]: pli for pli in plugins}
+
+
+def test_linked_updates_share_a_group_dependencies_first() -> None:
+    graph = buildGraph(
+        database(
+            plugin("Shop", depend=("Vault",)),
+            plugin("Vault"),
+            plugin("Chat"),
+        ),
+    )
+
+    assert groupUpdates(graph, ["shop", "chat", "vault"]) == [
+        ["vault", "shop"],
+        ["chat"],
+    ]
+
+
+def test_shared_dependency_not_updated_keeps_groups_apart() -> None:
+    # Both updates depend on Core, which stays as it is
+    graph = buildGraph(
+        database(
+            plugin("Core"),
+            plugin("Shop", depend=("Core",)),
+            plugin("Chat", depend=("Core",)),
+        ),
+    )
+
+    assert groupUpdates(graph, ["shop", "chat"]) == [["shop"], ["chat"]]
+
+
+def test_transitive_dependency_links_updates() -> None:
+    graph = buildGraph(
+        database(
+            plugin("Addon", depend=("Shop",)),
+            plugin("Shop", depend=("Vault",)),
+            plugin("Vault"),
+        ),
+    )
+
+    assert groupUpdates(graph, ["addon", "vault"]) == [["vault", "addon"]]
+
+
+def test_loadbefore_counts_as_reverse_dependency() -> None:
+    graph = buildGraph(database(plugin("Lib", loadbefore=("Shop",)), plugin("Shop")))
+
+    assert groupUpdates(graph, ["shop", "lib"]) == [["lib", "shop"]]
+    assert affectedBy(graph, ["lib"]) == {"shop"}
@@ -0,0 +1,29 @@
+import pathlib
+
+from history import History
+
+
+def jar(folder: pathlib.Path, version: str) -> pathlib.Path:
+    path = folder / f"Shop-{version}.jar"
+    path.write_text(f"Shop {version}")
+    return path
+
+
+def test_rolling_back_again_goes_further_back(tmp_path: pathlib.Path) -> None:
+    history = History(tmp_path / "history")
+    plugins = tmp_path / "plugins"
+    plugins.mkdir()
+
+    # 1.0 was replaced by 1.1, then 1.1 by 1.2
+    for version in "1.0", "1.1":
+        history.remove(jar(plugins, version), "a.Shop", "Shop", version)
+    installed = jar(plugins, "1.2")
+
+    entry = history.previous(plugins, "Shop", set())
+    assert entry["version"] == "1.1"
+    history.remove(installed, "a.Shop", "Shop", "1.2", rolledBack=True)
+    history.restore(entry)
+
+    entry = history.previous(plugins, "Shop", {entry["sha256"]})
+    assert entry["version"] == "1.0"
+
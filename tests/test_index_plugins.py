@@ -0,0 +1,60 @@
+import pytest
+from index_plugins import _load_yml, _scan_yml, get_dependencies, parse_descriptor
+from ruamel.yaml import YAMLError
+
+DESCRIPTORS = [
+    "name: Shop\nmain: a.Shop\nversion: 1.10\n",
+    "main: a.Shop\nversion: '2.0'  # quoted\ndepend: [Vault, 'Chat']\n",
+    'main: a.Shop\nversion: 1.0.0-SNAPSHOT\nsoftdepend:\n  - Vault\n  - "Chat"\n',
+    "main: a.Shop\nversion: 3\ncommands:\n  shop:\n    usage: /shop\n",
+    "---\nmain: a.Shop # main class\nversion: 1.2.3\n...\n",
+    "main:\ta.Shop\nversion: 1\n",
+    "main: a.Shop\nversion: 1\nversion: 2\n",
+    "main: a.Shop\nversion: 1\ncommands: {}\ncommands: {}\n",
+    "main: a.Shop\nversion: 1\ndepend:\n\t- Vault\n",
+]
+
+
+@pytest.mark.parametrize("contents", DESCRIPTORS)
+def test_scanner_agrees_with_yaml(contents: str) -> None:
+    scanned = _scan_yml(contents)
+    try:
+        loaded = _load_yml(contents)
+    except YAMLError:
+        # The fast path must not accept what the parser rejects
+        assert scanned is None
+        return
+
+    if scanned is not None:
+        for key, value in scanned.items():
+            assert loaded[key] == value
+
+
+@pytest.mark.parametrize(
+    ("contents", "version"),
+    [
+        ("main: a.Shop\nversion: 1.10\n", "1.10"),
+        ("main: a.Shop\nversion: 1.20\ndependencies:\n  server: {}\n", "1.20"),
+        ("main: a.Shop\nversion: 2.0\nfoo: [1, {x: 1}]\n", "2.0"),
+        ('{"id": "shop", "main": "a.Shop", "version": "1.10"}', "1.10"),
+    ],
+)
+def test_version_keeps_its_text(contents: str, version: str) -> None:
+    doc = parse_descriptor(contents, not contents.startswith("{"))
+
+    assert doc["version"] == version
+
+
+def test_paper_dependencies_map_onto_bukkit_keys() -> None:
+    doc = parse_descriptor(
+        "main: a.Shop\nversion: 1\ndependencies:\n  server:\n"
+        "    Vault:\n      required: true\n"
+        "    Chat:\n      required: false\n"
+        "    Addon:\n      load: AFTER\n",
+        is_yml=True,
+    )
+
+    deps = get_dependencies(doc, is_yml=True)
+    assert deps["depend"] == {"Vault"}
+    assert deps["softdepend"] == {"Chat"}
+    assert deps["loadbefore"] == {"Addon"}
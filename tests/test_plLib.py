@@ -0,0 +1,79 @@
+import os
+import pathlib
+import zipfile
+
+from index_plugins import no_dependencies
+from plLib import FolderIndex, PluginItem, firstMoreRecent, planItems, pluginItem
+
+
+def copy(
+    folder: pathlib.Path,
+    name: str,
+    version: str,
+    mtime: float,
+    data: bytes = b"jar",
+) -> PluginItem:
+    path = folder / name
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+    return pluginItem(path, "a.Shop", version, no_dependencies("Shop"))
+
+
+def kept(*copies: PluginItem) -> str:
+    plugindb, plan = planItems(copies)
+    assert [older["path"].name for older in plan[0]["delete"]] == sorted(
+        c["path"].name for c in copies if c is not plugindb["a.Shop"]
+    )
+    return plugindb["a.Shop"]["path"].name
+
+
+def test_higher_version_wins_over_newer_file(tmp_path: pathlib.Path) -> None:
+    old = copy(tmp_path, "Shop-old.jar", "1.10", 100)
+    new = copy(tmp_path, "Shop-new.jar", "1.9", 200)
+
+    assert kept(old, new) == "Shop-old.jar"
+    assert firstMoreRecent(old, new)
+    assert not firstMoreRecent(new, old)
+
+
+def test_equal_versions_keep_the_newer_file(tmp_path: pathlib.Path) -> None:
+    old = copy(tmp_path, "Shop-a.jar", "2.0", 100, b"build 1")
+    new = copy(tmp_path, "Shop-b.jar", "2.0", 200, b"build 2")
+
+    assert kept(new, old) == "Shop-b.jar"
+    assert firstMoreRecent(new, old)
+    assert not firstMoreRecent(old, new)
+
+
+def test_equal_size_rebuild_is_newer(tmp_path: pathlib.Path) -> None:
+    old = copy(tmp_path, "Shop-a.jar", "2.0", 100, b"build 1")
+    new = copy(tmp_path, "Shop-b.jar", "2.0", 200, b"build 2")
+
+    assert old["path"].stat().st_size == new["path"].stat().st_size
+    assert firstMoreRecent(new, old)
+
+
+def test_identical_copy_is_not_newer(tmp_path: pathlib.Path) -> None:
+    old = copy(tmp_path, "Shop-a.jar", "2.0", 100)
+    new = copy(tmp_path, "Shop-b.jar", "2.0", 200)
+
+    assert not firstMoreRecent(new, old)
+
+
+def test_exact_ties_are_broken_by_contents(tmp_path: pathlib.Path) -> None:
+    one = copy(tmp_path, "Shop-a.jar", "2.0", 100, b"aaa")
+    two = copy(tmp_path, "Shop-b.jar", "2.0", 100, b"bbb")
+
+    assert kept(one, two) == kept(two, one)
+
+
+def test_prune_skips_files_deleted_behind_the_index(tmp_path: pathlib.Path) -> None:
+    for name, version in ("Shop-1.jar", "1.0"), ("Shop-2.jar", "2.0"):
+        with zipfile.ZipFile(tmp_path / name, "w") as z:
+            z.writestr("plugin.yml", f"name: Shop\nmain: a.Shop\nversion: {version}\n")
+    index = FolderIndex(tmp_path)
+    (tmp_path / "Shop-1.jar").unlink()
+
+    index.prune()
+
+    assert list(index.items) == [tmp_path / "Shop-2.jar"]
@@ -0,0 +1,64 @@
+import pathlib
+
+import pytest
+from schedule import MAX_INTERVAL, MIN_INTERVAL, Schedule
+from stateDb import StateDb
+
+
+@pytest.fixture
+def db(tmp_path: pathlib.Path) -> StateDb:
+    return StateDb(tmp_path)
+
+
+def run(db: StateDb, now: float, observed: str) -> Schedule:
+    s = Schedule(db)
+    s.now = now
+    if s.due("jenkins", "job"):
+        s.record("jenkins", "job", observed)
+    return s
+
+
+def interval(db: StateDb) -> float:
+    return db.plugin("jenkins", "job")["interval"]
+
+
+def test_unchanged_plugin_backs_off_up_to_a_week(db: StateDb) -> None:
+    now = 0.0
+    run(db, now, "build 1")
+    assert interval(db) == 0
+
+    seen = []
+    while len(seen) < 12:
+        now += interval(db) or 1
+        run(db, now, "build 1")
+        seen.append(interval(db))
+
+    assert seen[:4] == [
+        MIN_INTERVAL,
+        2 * MIN_INTERVAL,
+        4 * MIN_INTERVAL,
+        8 * MIN_INTERVAL,
+    ]
+    assert max(seen) == MAX_INTERVAL
+    assert seen[-1] == MAX_INTERVAL
+
+
+def test_plugin_is_not_checked_before_it_is_due(db: StateDb) -> None:
+    run(db, 0.0, "build 1")
+    run(db, 1.0, "build 1")
+    assert interval(db) == MIN_INTERVAL
+
+    skipped = run(db, MIN_INTERVAL, "build 2")
+    assert skipped.skipped == 1
+    assert db.plugin("jenkins", "job")["observed"] == "build 1"
+
+
+def test_change_resets_the_interval(db: StateDb) -> None:
+    run(db, 0.0, "build 1")
+    run(db, 1.0, "build 1")
+    run(db, 1.0 + MIN_INTERVAL, "build 1")
+    assert interval(db) == 2 * MIN_INTERVAL
+
+    run(db, 1.0 + 3 * MIN_INTERVAL, "build 2")
+    assert interval(db) == 0
+    assert Schedule(db).due("jenkins", "job")
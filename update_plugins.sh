@@ -25,40 +25,29 @@ mkdir -p "$VELOCITY_DIR"
 mkdir -p "$SPIGOT_DIR"
 
 
-# --- STEP 3: Download Plugins to Staging Directories ---
-# The following section downloads plugins from various sources into the staging directories.
-echo "--- Starting plugin downloads into staging directories... ---"
-
-# Download from Jenkins servers (e.g., PaperMC, Empire Minecraft).
-./updater/download_jenkins.py --tar "$AUTOSPIGOT_DIR"
-./updater/download_jenkins.py --tar "$VELOCITY_DIR"
-
-# Download from Modrinth, a modern platform for Minecraft mods and plugins.
-./updater/download_modrinth.py --tar "$AUTOSPIGOT_DIR" --loader paper
-./updater/download_modrinth.py --tar "$VELOCITY_DIR" --loader velocity
-
-# Download from Spiget, the unofficial API for SpigotMC resources.
-./updater/download_spiget.py --tar "$AUTOSPIGOT_DIR"
-
-# Download plugins from direct URLs using a generic downloader script.
-./updater/oget.py https://download.geysermc.org/v2/projects/floodgate/versions/latest/builds/latest/downloads/spigot -O "$AUTOSPIGOT_DIR/floodgate-spigot.jar"
-./updater/oget.py https://download.geysermc.org/v2/projects/geyser/versions/latest/builds/latest/downloads/spigot -O "$AUTOSPIGOT_DIR/Geyser-Spigot.jar"
-
-echo "Plugin downloads complete."
-
-
-# --- STEP 4: Prune Old Versions from Staging Directories ---
-# Before syncing, clean up the staging directories by removing older duplicates.
-echo "--- Pruning old plugin versions from staging directories... ---"
-./updater/pruneDb.py --tar "$AUTOSPIGOT_DIR"
-./updater/pruneDb.py --tar "$VELOCITY_DIR"
-echo "Pruning complete."
-
-
-# --- STEP 5: Sync Latest Plugins to Final Database ---
+# --- STEP 3: Download Plugins and Prune Old Versions ---
+# The pipeline runs every downloader against the staging directories:
+#   - Jenkins servers (e.g., PaperMC, Empire Minecraft), with JARs shared between directories fetched once.
+#   - Modrinth, a modern platform for Minecraft mods and plugins.
+#   - Spiget, the unofficial API for SpigotMC resources.
+#   - Direct URLs, through the generic oget downloader.
+# Each JAR is indexed as soon as it lands and the version it supersedes is deleted,
+# so the staging directories are already pruned when the last download finishes.
+echo "--- Downloading plugins into staging directories and pruning old versions... ---"
+./updater/pipeline.py \
+    --staging "$AUTOSPIGOT_DIR" paper \
+    --staging "$VELOCITY_DIR" velocity \
+    --url https://download.geysermc.org/v2/projects/floodgate/versions/latest/builds/latest/downloads/spigot "$AUTOSPIGOT_DIR/floodgate-spigot.jar" \
+    --url https://download.geysermc.org/v2/projects/geyser/versions/latest/builds/latest/downloads/spigot "$AUTOSPIGOT_DIR/Geyser-Spigot.jar"
+echo "Plugin downloads and pruning complete."
+
+
+# --- STEP 4: Sync Latest Plugins to Final Database ---
 # Use rsync to efficiently copy new and updated files to the final repository.
 # The --delete flag ensures that plugins removed from staging are also removed from the final repo.
+# The staging directory's own state store stays behind, the final repo keeps its own,
+# and so do the JARs the pipeline quarantined as broken.
 echo "--- Syncing latest plugins to the final database... ---"
-rsync -av --delete "$AUTOSPIGOT_DIR/" "$SPIGOT_DIR/"
+rsync -av --delete --exclude 'state.db*' --exclude quarantine/ "$AUTOSPIGOT_DIR/" "$SPIGOT_DIR/"
 echo "Sync complete. The local plugin database is now up-to-date."
 
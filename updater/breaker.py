@@ -0,0 +1,169 @@
+import asyncio
+import os
+import sqlite3
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from stateDb import StateDb
+
+# Consecutive failures before a host is skipped
+FAILURE_THRESHOLD = 3
+# Skipped hosts are probed again after this, doubling while probes fail
+PROBE_INTERVAL = 15 * 60
+MAX_PROBE_INTERVAL = 24 * 60 * 60
+
+
+class Budget(NamedTuple):
+    """Seconds allowed to connect, between reads and for a whole request."""
+
+    connect: float
+    read: float
+    total: float
+
+
+DEFAULT_BUDGETS = {
+    "jenkins": Budget(10, 30, 60),
+    "modrinth": Budget(5, 10, 30),
+    "spiget": Budget(10, 30, 300),
+    "url": Budget(10, 30, 300),
+    "papermc": Budget(10, 30, 300),
+}
+
+
+def budget(source: str) -> Budget:
+    """Budget of a source, overridden by UPDATER_TIMEOUT_<SOURCE>=connect,read,total."""
+    override = os.environ.get(f"UPDATER_TIMEOUT_{source.upper()}")
+    if override:
+        return Budget(*(float(i) for i in override.split(",")))
+    return DEFAULT_BUDGETS[source]
+
+
+def clientTimeout(source: str) -> aiohttp.ClientTimeout:
+    b = budget(source)
+    return aiohttp.ClientTimeout(
+        total=b.total, sock_connect=b.connect, sock_read=b.read
+    )
+
+
+def requestsTimeout(source: str) -> tuple[float, float]:
+    b = budget(source)
+    return b.connect, b.read
+
+
+def wgetArgs(source: str) -> list[str]:
+    """Timeouts for wget, which otherwise retries 20 times with no read limit."""
+    b = budget(source)
+    return [f"--connect-timeout={b.connect}", f"--read-timeout={b.read}", "--tries=2"]
+
+
+def hostOf(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def hostFailed(error: BaseException | None) -> bool:
+    """Whether an error means the host is down rather than the request was bad."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(
+        error,
+        aiohttp.ClientConnectionError
+        | requests.ConnectionError
+        | ConnectionError
+        | requests.Timeout
+        | TimeoutError,
+    )
+
+
+class HostUnavailable(Exception):
+    """A request was skipped because its host keeps failing."""
+
+
+class CircuitBreaker:
+    """Per-host failure counts, persisted so dead hosts stay skipped across runs.
+
+    A host failing in FAILURE_THRESHOLD consecutive runs is skipped until
+    its probe time, when a single request is let through. Success closes the
+    circuit, failure doubles the time to the next probe. Each host is settled
+    once per run: any failure wins over successes, and many count once.
+    """
+
+    def __init__(self, db: StateDb, source: str) -> None:
+        self.db = db
+        self.source = source
+        self.probing: set[str] = set()
+        self.failed: set[str] = set()
+        # Host state as the run found it, before this run's outcomes
+        self.initial: dict[str, sqlite3.Row | None] = {}
+        self.skipped: Counter[str] = Counter()
+
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return clientTimeout(self.source)
+
+    def allow(self, host: str) -> bool:
+        entry = self.db.host(host)
+        if entry is None or entry["failures"] < FAILURE_THRESHOLD:
+            return True
+
+        if host not in self.probing and entry["retry"] <= time.time():
+            print(f"Probing {host} after {entry['failures']} failures")
+            self.probing.add(host)
+            return True
+
+        self.skipped[host] += 1
+        return False
+
+    def record(self, host: str, error: BaseException | None) -> None:
+        probe = host in self.probing
+        self.probing.discard(host)
+        if host not in self.initial:
+            self.initial[host] = self.db.host(host)
+        if host in self.failed:
+            return
+
+        if not hostFailed(error):
+            if self.db.host(host) is not None:
+                self.db.clearHost(host)
+            return
+        self.failed.add(host)
+
+        entry = self.initial[host]
+        # Only a failed probe pushes an open circuit's next probe further out
+        if entry is not None and entry["failures"] >= FAILURE_THRESHOLD and not probe:
+            return
+        failures = 1 if entry is None else entry["failures"] + 1
+        retry = time.time()
+        if failures >= FAILURE_THRESHOLD:
+            interval = PROBE_INTERVAL * 2 ** (failures - FAILURE_THRESHOLD)
+            retry += min(MAX_PROBE_INTERVAL, interval)
+            print(f"Skipping {host} until {time.ctime(retry)}: {error!r}")
+        self.db.setHost(host, failures, retry)
+
+    @contextmanager
+    def call(self, url: str) -> Iterator[None]:
+        """Guard a request to url, raising HostUnavailable if its host is skipped."""
+        host = hostOf(url)
+        if not self.allow(host):
+            msg = f"Skipped {url}, {host} keeps failing"
+            raise HostUnavailable(msg)
+
+        try:
+            yield
+        except Exception as e:
+            self.record(host, e)
+            raise
+        except asyncio.CancelledError:
+            self.probing.discard(host)
+            raise
+        self.record(host, None)
+
+    def report(self) -> None:
+        for host, count in self.skipped.items():
+            print(f"Skipped {count} requests to {host}, which keeps failing.")
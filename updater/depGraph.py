@@ -0,0 +1,92 @@
+from collections.abc import Iterable
+from graphlib import CycleError, TopologicalSorter
+from typing import TypedDict
+
+from plLib import PluginItem
+
+
+class DependencyGraph(TypedDict):
+    """Load-order edges between artifacts of one plugin database."""
+
+    requires: dict[str, set[str]]  # artifact -> artifacts loaded before it
+    dependents: dict[str, set[str]]  # artifact -> artifacts loaded after it
+
+
+def buildGraph(plugindb: dict[str, PluginItem]) -> DependencyGraph:
+    """Resolve declared plugin names to artifacts present in the database."""
+    byName = {
+        pli["deps"]["name"].lower(): artifact
+        for artifact, pli in plugindb.items()
+        if pli["deps"]["name"]
+    }
+    requires: dict[str, set[str]] = {artifact: set() for artifact in plugindb}
+
+    for artifact, pli in plugindb.items():
+        deps = pli["deps"]
+        for name in deps["depend"] | deps["softdepend"]:
+            other = byName.get(name.lower())
+            if other is not None and other != artifact:
+                requires[artifact].add(other)
+
+        # loadbefore is a dependency declared from the other side
+        for name in deps["loadbefore"]:
+            other = byName.get(name.lower())
+            if other is not None and other != artifact:
+                requires[other].add(artifact)
+
+    dependents: dict[str, set[str]] = {artifact: set() for artifact in plugindb}
+    for artifact, reqs in requires.items():
+        for req in reqs:
+            dependents[req].add(artifact)
+
+    return {"requires": requires, "dependents": dependents}
+
+
+def _reach(edges: dict[str, set[str]], start: Iterable[str]) -> set[str]:
+    seen: set[str] = set()
+    stack = list(start)
+    while stack:
+        for nxt in edges.get(stack.pop(), ()):
+            if nxt not in seen:
+                seen.add(nxt)
+                stack.append(nxt)
+
+    return seen
+
+
+def affectedBy(graph: DependencyGraph, artifacts: Iterable[str]) -> set[str]:
+    """Artifacts that transitively depend on any of the given ones."""
+    artifacts = set(artifacts)
+    return _reach(graph["dependents"], artifacts) - artifacts
+
+
+def groupUpdates(graph: DependencyGraph, artifacts: Iterable[str]) -> list[list[str]]:
+    """Group updated artifacts linked through dependencies, dependencies first."""
+    updated = list(dict.fromkeys(artifacts))
+    parent = {artifact: artifact for artifact in updated}
+
+    def find(artifact: str) -> str:
+        while parent[artifact] != artifact:
+            parent[artifact] = parent[parent[artifact]]
+            artifact = parent[artifact]
+        return artifact
+
+    closure = {a: _reach(graph["requires"], (a,)) & parent.keys() for a in updated}
+    for artifact, reqs in closure.items():
+        for req in reqs:
+            parent[find(req)] = find(artifact)
+
+    groups: dict[str, list[str]] = {}
+    for artifact in updated:
+        groups.setdefault(find(artifact), []).append(artifact)
+
+    ordered = []
+    for members in groups.values():
+        sorter = TopologicalSorter({m: closure[m] for m in members})
+        try:
+            ordered.append(list(sorter.static_order()))
+        except CycleError:
+            # Soft dependency cycles have no defined order, keep index order
+            ordered.append(members)
+
+    return ordered
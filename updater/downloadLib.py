@@ -1,55 +1,278 @@
+import asyncio
 import os
 import pathlib
+import re
+import shutil
+import time
+from collections.abc import Iterable
+from contextlib import AbstractContextManager, nullcontext
 from email.utils import parsedate_to_datetime
+from urllib.parse import unquote, urlparse
 
 import aiohttp
 from aiohttp.typedefs import CIMultiDictProxy
+from breaker import CircuitBreaker, HostUnavailable, budget, clientTimeout, wgetArgs
+from stateDb import StateDb
+
+UPDATER_DIR = pathlib.Path(__file__).resolve().parent
 
 USER_AGENT = "AutoPlug 1.1"
 DEFAULT_HEADERS = {"User-Agent": USER_AGENT}
 
+SERVER_ERROR = re.compile(r"ERROR 5\d\d")
+
+
+def downloaderCommands(
+    staging: list[tuple[pathlib.PosixPath, str]],
+    urls: list[tuple[str, pathlib.PosixPath]],
+) -> list[tuple[tuple[str, ...], list[pathlib.PosixPath]]]:
+    """Downloader scripts to run for staging folders and loaders and direct urls.
+
+    Each command comes with the folders it writes to.
+    """
+    commands = []
+    if staging:
+        # One run per downloader covers every staging folder, sharing downloads
+        tars = [tar for tar, _ in staging]
+        jenkins = [str(UPDATER_DIR / "download_jenkins.py")]
+        modrinth = [str(UPDATER_DIR / "download_modrinth.py")]
+        for tar, loader in staging:
+            jenkins += ["--tar", str(tar)]
+            modrinth += ["--tar", str(tar), "--loader", loader]
+
+        commands += [(tuple(jenkins), tars), (tuple(modrinth), tars)]
+        commands += [
+            ((str(UPDATER_DIR / "download_spiget.py"), "--tar", str(tar)), [tar])
+            for tar in tars
+        ]
+
+    commands += [
+        ((str(UPDATER_DIR / "oget.py"), url, "-O", str(dest)), [dest.parent])
+        for url, dest in urls
+    ]
+    return commands
+
 
 def set_cwd(path: pathlib.Path) -> None:
     """Change current working directory."""
     os.chdir(path)
 
 
+def urlFilename(url: str) -> str:
+    """Name wget gives a file downloaded from url."""
+    return unquote(pathlib.PurePosixPath(urlparse(url).path).name)
+
+
+def linkInto(src: pathlib.Path, tars: Iterable[pathlib.Path]) -> None:
+    """Hardlink a downloaded file into other target directories.
+
+    Falls back to copying across filesystems. Existing copies are replaced
+    atomically.
+    """
+    for tar in tars:
+        dest = tar / src.name
+        if dest.exists() and dest.samefile(src):
+            continue
+
+        tmp = dest.with_name(f".{dest.name}.link")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        tmp.replace(dest)
+
+
+def _guard(url: str, breaker: CircuitBreaker | None) -> AbstractContextManager:
+    return nullcontext() if breaker is None else breaker.call(url)
+
+
+async def wget(
+    url: str,
+    cwd: pathlib.Path,
+    userAgent: str,
+    source: str,
+    breaker: CircuitBreaker | None = None,
+) -> bool:
+    """wget -N url into cwd within the source's budget, False if it failed.
+
+    Only network failures and 5xx responses count against the host.
+    """
+    try:
+        with _guard(url, breaker):
+            p = await asyncio.create_subprocess_exec(
+                "wget",
+                "-U",
+                userAgent,
+                "-nv",
+                "-N",
+                *wgetArgs(source),
+                url,
+                cwd=cwd,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                _, stderr = await asyncio.wait_for(
+                    p.communicate(),
+                    budget(source).total,
+                )
+            except TimeoutError:
+                p.kill()
+                await p.wait()
+                raise
+
+            log = stderr.decode(errors="replace").strip()
+            # Exit status 4 is a network failure, 8 an error response
+            if p.returncode == 4 or (p.returncode == 8 and SERVER_ERROR.search(log)):
+                msg = f"wget could not fetch {url}: {log}"
+                raise ConnectionError(msg)
+    except (HostUnavailable, ConnectionError, TimeoutError) as e:
+        print(f"Error fetching {url}: {e!r}")
+        return False
+
+    if p.returncode:
+        print(f"Error fetching {url}: wget exit status {p.returncode}: {log}")
+        return False
+
+    return True
+
+
 def _emailDateToUnix(date: str) -> int:
     return int(parsedate_to_datetime(date).timestamp())
 
 
-async def _getHeaders(url: str) -> CIMultiDictProxy:
-    async with (
-        aiohttp.ClientSession(headers=DEFAULT_HEADERS) as session,
-        session.head(url, allow_redirects=True) as response,
-    ):
-        if "java-archive" not in response.headers["Content-Type"]:
-            print("WARNING", url, response.headers["Content-Type"])
-        response.raise_for_status()  # Raises an HTTPError for bad responses
-        return response.headers
-
-
-async def _getContent(url: str) -> tuple[bytes, str, str]:
-    async with (
-        aiohttp.ClientSession(headers=DEFAULT_HEADERS) as session,
-        session.get(url, allow_redirects=True) as response,
-    ):
-        if "java-archive" not in response.headers["Content-Type"]:
-            print("WARNING", url, response.headers["Content-Type"])
-        response.raise_for_status()  # Raises an HTTPError for bad responses
-        return (
-            await response.content.read(),
-            response.headers["Last-Modified"],
-            str(response.url),
+class RedirectCache:
+    """Persistent map of redirecting urls to the url they resolve to.
+
+    Requests go straight to the final url. The entry point is revalidated
+    with a single non-following HEAD once REVALIDATE_AFTER has passed, and
+    the chain is walked again when its first hop or ETag changed or the
+    final url is gone (404/410) or refused, as expired signed links are.
+    """
+
+    REVALIDATE_AFTER = 60 * 60
+
+    def __init__(self, db: StateDb) -> None:
+        self.db = db
+
+    async def resolve(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        breaker: CircuitBreaker | None = None,
+    ) -> str:
+        entry = self.db.redirect(url)
+        if entry is None:
+            return url
+
+        if time.time() - entry["checked"] < self.REVALIDATE_AFTER:
+            return entry["final"]
+
+        headers = {"If-None-Match": entry["etag"]} if entry["etag"] else {}
+        with _guard(url, breaker):
+            r = await session.head(url, allow_redirects=False, headers=headers)
+        async with r:
+            unchanged = r.status == 304 or (
+                r.headers.get("Location", "") == entry["location"]
+                and r.headers.get("ETag", "") == entry["etag"]
+            )
+
+        if not unchanged:
+            self.db.dropRedirect(url)
+            return url
+
+        self.db.setRedirect(
+            url,
+            entry["final"],
+            entry["location"],
+            entry["etag"],
+            time.time(),
         )
+        return entry["final"]
+
+    def check(self, url: str, target: str, response: aiohttp.ClientResponse) -> bool:
+        """Learn from a response, False if the cached target must be re-resolved."""
+        if target != url:
+            if response.status in (401, 403, 404, 410):
+                self.db.dropRedirect(url)
+                return False
+            return True
+
+        if response.history:
+            first = response.history[0]
+            self.db.setRedirect(
+                url,
+                str(response.url),
+                first.headers.get("Location", ""),
+                first.headers.get("ETag", ""),
+                time.time(),
+            )
+        return True
+
+
+async def _getHeaders(
+    url: str,
+    cache: RedirectCache | None = None,
+    breaker: CircuitBreaker | None = None,
+) -> CIMultiDictProxy:
+    timeout = breaker.timeout() if breaker else clientTimeout("url")
+    async with aiohttp.ClientSession(
+        headers=DEFAULT_HEADERS,
+        timeout=timeout,
+    ) as session:
+        while True:
+            target = await cache.resolve(session, url, breaker) if cache else url
+            # Failures count against the host actually requested
+            with _guard(target, breaker):
+                async with session.head(target, allow_redirects=True) as response:
+                    # A stale target is dropped, the next pass walks the chain
+                    if cache is not None and not cache.check(url, target, response):
+                        continue
+
+                    if "java-archive" not in response.headers["Content-Type"]:
+                        print("WARNING", url, response.headers["Content-Type"])
+                    response.raise_for_status()  # Raises an HTTPError for bad responses
+                    return response.headers
+
+
+async def _getContent(
+    url: str,
+    cache: RedirectCache | None = None,
+    breaker: CircuitBreaker | None = None,
+) -> tuple[bytes, str, str]:
+    timeout = breaker.timeout() if breaker else clientTimeout("url")
+    async with aiohttp.ClientSession(
+        headers=DEFAULT_HEADERS,
+        timeout=timeout,
+    ) as session:
+        while True:
+            target = await cache.resolve(session, url, breaker) if cache else url
+            with _guard(target, breaker):
+                async with session.get(target, allow_redirects=True) as response:
+                    if cache is not None and not cache.check(url, target, response):
+                        continue
+
+                    if "java-archive" not in response.headers["Content-Type"]:
+                        print("WARNING", url, response.headers["Content-Type"])
+                    response.raise_for_status()  # Raises an HTTPError for bad responses
+                    return (
+                        await response.content.read(),
+                        response.headers["Last-Modified"],
+                        str(response.url),
+                    )
 
 
-async def shouldDownload(url: str, dest: pathlib.PosixPath) -> bool:
+async def shouldDownload(
+    url: str,
+    dest: pathlib.PosixPath,
+    cache: RedirectCache | None = None,
+    breaker: CircuitBreaker | None = None,
+) -> bool:
     """Download if file size or modified does not match."""
     if not dest.is_file():
         return True
 
-    headers = await _getHeaders(url)
+    headers = await _getHeaders(url, cache, breaker)
     contentLength = int(headers.get("Content-Length", 0))
     if contentLength and contentLength != dest.stat().st_size:
         return True
@@ -57,8 +280,13 @@ async def shouldDownload(url: str, dest: pathlib.PosixPath) -> bool:
     return _emailDateToUnix(headers["Last-Modified"]) != int(dest.stat().st_mtime)
 
 
-async def downloadFile(url: str, dest: pathlib.PosixPath) -> str:
-    content, lastModified, url = await _getContent(url)
+async def downloadFile(
+    url: str,
+    dest: pathlib.PosixPath,
+    cache: RedirectCache | None = None,
+    breaker: CircuitBreaker | None = None,
+) -> str:
+    content, lastModified, url = await _getContent(url, cache, breaker)
     dest.write_bytes(content)
     mtime = _emailDateToUnix(lastModified)
     os.utime(dest, (mtime, mtime))
@@ -1,18 +1,22 @@
 #!/usr/bin/env python3
 import argparse
 import asyncio
-import os
 import pathlib
 from collections.abc import Generator
 from urllib.parse import urljoin
 
 import aiohttp
+import profiling
+from breaker import CircuitBreaker
+from downloadLib import linkInto, urlFilename, wget
 from lxml import html
+from schedule import Schedule
+from stateDb import StateDb
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
 
 
-def parseArgs() -> pathlib.PosixPath:
+def parseArgs() -> tuple[list[pathlib.PosixPath], bool]:
     parser = argparse.ArgumentParser(
         description="Update local repository using github or jenkins repository.",
     )
@@ -20,73 +24,201 @@ def parseArgs() -> pathlib.PosixPath:
     parser.add_argument(
         "--tar",
         type=pathlib.PosixPath,
+        action="append",
         required=True,
-        help="Path to the target directory.",
+        help="Path to a target directory. Repeat to share downloads between them.",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Check every plugin, even those not due for a check.",
     )
 
-    return parser.parse_args().tar.resolve()
+    args = parser.parse_args()
+    return [tar.resolve() for tar in args.tar], args.all
 
 
-async def readHtml(url: str) -> str:
+async def readHtml(url: str, timeout: aiohttp.ClientTimeout) -> str:
     headers = {
         "User-Agent": USER_AGENT,
         "Referer": url,
     }
     async with (
-        aiohttp.ClientSession(headers=headers) as session,
+        aiohttp.ClientSession(headers=headers, timeout=timeout) as session,
         session.get(url, allow_redirects=True) as response,
     ):
         response.raise_for_status()  # Raises an HTTPError for bad responses
         return await response.text()
 
 
+async def readJson(url: str, timeout: aiohttp.ClientTimeout) -> dict:
+    async with (
+        aiohttp.ClientSession(
+            headers={"User-Agent": USER_AGENT}, timeout=timeout
+        ) as session,
+        session.get(url, allow_redirects=True) as response,
+    ):
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+def _wanted(jar: str) -> bool:
+    return not jar.endswith("javadoc.jar") and not jar.endswith("sources.jar")
+
+
 def listJars(content: str) -> Generator[str]:
     assert content
     tree = html.fromstring(content)
     for j in tree.xpath(
         '//a[substring(@href, string-length(@href) - 3) = ".jar"]/@href',
     ):
-        if not j.endswith("javadoc.jar") and not j.endswith("sources.jar"):
+        if _wanted(j):
             yield j
 
 
-async def updateDb(url: str, jar: str) -> None:
+async def lastBuild(url: str, breaker: CircuitBreaker) -> tuple[str, list[str]] | None:
+    """Number and jar links of a Jenkins job's last successful build.
+
+    None if url is not a Jenkins job, or its build lists no jars.
+    """
+    api = urljoin(
+        url, "lastSuccessfulBuild/api/json?tree=number,artifacts[relativePath]"
+    )
+    try:
+        with breaker.call(url):
+            build = await readJson(api, breaker.timeout())
+        number = int(build["number"])
+        jars = [a["relativePath"] for a in build["artifacts"]]
+    except (aiohttp.ClientResponseError, ValueError, KeyError, TypeError):
+        return None
+
+    links = [
+        urljoin(url, f"{number}/artifact/{j}")
+        for j in jars
+        if j.endswith(".jar") and _wanted(j)
+    ]
+    if not links:
+        return None
+    return f"build {number}", sorted(links)
+
+
+async def updateDb(
+    link: str,
+    tars: list[pathlib.PosixPath],
+    page: str,
+    dbs: dict[pathlib.PosixPath, StateDb],
+    breaker: CircuitBreaker,
+) -> bool:
+    """Fetch one jar into every target, False if the download failed."""
     # Always use wget -N
     # Then auto delete anything older (separate script)
-    link = urljoin(url, jar)
-    p = await asyncio.create_subprocess_exec("wget", "-U", USER_AGENT, "-qN", link)
-    await p.communicate()
-
-
-async def checkJenkins(url: str) -> None:
+    jar = tars[0] / urlFilename(link)
+    before = jar.stat().st_mtime if jar.is_file() else None
+    if not await wget(link, tars[0], USER_AGENT, "jenkins", breaker):
+        return False
+
+    if not jar.is_file():
+        return True
+
+    linkInto(jar, tars[1:])
+    if jar.stat().st_mtime != before:
+        for tar in tars:
+            dbs[tar].recordFile(tar / jar.name, "jenkins", page, link)
+    return True
+
+
+async def checkJenkins(
+    url: str,
+    breaker: CircuitBreaker,
+) -> tuple[str, list[str]] | None:
+    """Change marker and links of the jars at url.
+
+    The marker is the build number of Jenkins jobs, else the listed links,
+    which carry the release tag on GitHub. None on error or if the host is
+    skipped.
+    """
     if not url.endswith("/"):
         # Otherwise url join will silently fail and provide wrong url
         print(f"Invalid url {url}")
-        return
+        return None
     try:
-        jars = set(listJars(await readHtml(url)))
+        if "github.com" not in url:
+            build = await lastBuild(url, breaker)
+            if build is not None:
+                return build
+
+        with breaker.call(url):
+            page = await readHtml(url, breaker.timeout())
+        jars = set(listJars(page))
 
         if "github.com" in url:
             jars = [j for j in jars if "releases/download" in j]
     except Exception as e:
         print(f"Error fetching {url}: {e}")
-        return
+        return None
     else:
-        await asyncio.gather(*(updateDb(url, jar) for jar in jars))
+        links = sorted(urljoin(url, jar) for jar in jars)
+        return ",".join(links), links
 
 
 async def main() -> None:
-    os.chdir(parseArgs())
-
-    try:
-        text = pathlib.Path("jenkins.txt").read_text(encoding="utf-8")
-        URLS = [i.strip() for i in text.splitlines() if i.strip()]
-    except FileNotFoundError:
-        print("jenkins.txt not found in path.")
-    else:
+    tars, checkAll = parseArgs()
+
+    # Plan across every target so shared urls and jars are fetched once
+    dbs: dict[pathlib.PosixPath, StateDb] = {}
+    schedules: dict[pathlib.PosixPath, Schedule] = {}
+    urlTargets: dict[str, list[pathlib.PosixPath]] = {}
+    for tar in tars:
+        db = StateDb(tar)
+        if not db.importConfig("jenkins") and not db.plugins("jenkins"):
+            print(f"jenkins.txt not found in {tar}.")
+            continue
+
+        URLS = [row["key"] for row in db.plugins("jenkins")]
         assert URLS
-        await asyncio.gather(*(checkJenkins(url) for url in URLS))
+        dbs[tar] = db
+        schedules[tar] = Schedule(db, force=checkAll)
+        for url in URLS:
+            if schedules[tar].due("jenkins", url):
+                urlTargets.setdefault(url, []).append(tar)
+
+    if not dbs:
+        return
+
+    # Host health is kept in the first target's store
+    breaker = CircuitBreaker(next(iter(dbs.values())), "jenkins")
+    urls = list(urlTargets)
+    listings = await asyncio.gather(*(checkJenkins(url, breaker) for url in urls))
+
+    linkTargets: dict[str, tuple[str, list[pathlib.PosixPath]]] = {}
+    for url, listing in zip(urls, listings, strict=True):
+        for link in listing[1] if listing else ():
+            _, targets = linkTargets.setdefault(link, (url, []))
+            targets += [t for t in urlTargets[url] if t not in targets]
+
+    results = await asyncio.gather(
+        *(
+            updateDb(link, t, page, dbs, breaker)
+            for link, (page, t) in linkTargets.items()
+        ),
+    )
+    # Pages with a failed download are checked again next run
+    failed = {
+        page
+        for ok, (page, _) in zip(results, linkTargets.values(), strict=True)
+        if not ok
+    }
+
+    for url, listing in zip(urls, listings, strict=True):
+        if listing is None or url in failed:
+            continue
+        for tar in urlTargets[url]:
+            schedules[tar].record("jenkins", url, listing[0])
+
+    for schedule in schedules.values():
+        schedule.report()
+    breaker.report()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    profiling.run(main)
@@ -7,7 +7,12 @@ import pathlib
 from collections.abc import Iterator
 from typing import Literal, NewType, cast
 
+import profiling
 import requests
+from breaker import CircuitBreaker, HostUnavailable, requestsTimeout
+from downloadLib import linkInto, urlFilename, wget
+from schedule import Schedule
+from stateDb import StateDb
 
 logging.basicConfig(level=logging.INFO)
 
@@ -21,7 +26,10 @@ PluginMap = dict[PluginId, UpdateTime]
 Loader = Literal["paper", "velocity"]
 
 
-def parseArgs() -> tuple[pathlib.PosixPath, Loader]:
+Target = tuple[pathlib.PosixPath, Loader, str | None]
+
+
+def parseArgs() -> tuple[list[Target], bool]:
     parser = argparse.ArgumentParser(
         description="Update local repository using modrinth repository.",
     )
@@ -29,108 +37,231 @@ def parseArgs() -> tuple[pathlib.PosixPath, Loader]:
     parser.add_argument(
         "--tar",
         type=pathlib.PosixPath,
+        action="append",
         required=True,
-        help="Path to the target directory.",
+        help="Path to a target directory. Repeat to share downloads between them.",
     )
     parser.add_argument(
         "--loader",
         choices=["paper", "velocity"],
+        action="append",
         required=True,
-        help="Pick loader for plugins.",
+        help="Pick loader for plugins, once per --tar.",
+    )
+    parser.add_argument(
+        "--game-version",
+        action="append",
+        default=[],
+        help='Only consider versions supporting this Minecraft version, once per --tar. "any" disables the filter.',
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Check every plugin, even those not due for a check.",
     )
 
     args = parser.parse_args()
-    return args.tar.resolve(), args.loader
+    if len(args.tar) != len(args.loader):
+        parser.error("Give one --loader per --tar.")
+    if args.game_version and len(args.game_version) != len(args.tar):
+        parser.error("Give one --game-version per --tar, or none.")
 
+    versions = [None if v == "any" else v for v in args.game_version]
+    targets = [
+        (tar.resolve(), loader, version)
+        for tar, loader, version in zip(
+            args.tar,
+            args.loader,
+            versions or [None] * len(args.tar),
+            strict=True,
+        )
+    ]
+    return targets, args.all
 
-def get_latest_file(name: str, loader: Loader) -> str | None:
-    # May need to cache the id -> Location
-    url = f"https://api.modrinth.com/v2/project/{name}/version"
-    versions = requests.get(url, timeout=10).json()
 
-    for v in versions:  # Assuume sorted
-        if loader in v["loaders"]:
-            return v["files"][0]["url"]
+def get_latest_file(
+    name: str,
+    loader: Loader,
+    breaker: CircuitBreaker,
+    game_version: str | None = None,
+) -> str | None:
+    """Newest file for loader, filtered by the API rather than locally."""
+    params = {"loaders": json.dumps([loader]), "include_changelog": "false"}
+    if game_version:
+        params["game_versions"] = json.dumps([game_version])
 
-    return None
+    url = f"https://api.modrinth.com/v2/project/{name}/version"
+    with breaker.call(url):
+        response = requests.get(url, params=params, timeout=requestsTimeout("modrinth"))
+        response.raise_for_status()
+    versions = response.json()
+    if not versions:
+        return None
 
+    latest = max(versions, key=lambda v: v["date_published"])
+    files = latest["files"]
+    return next((f for f in files if f.get("primary")), files[0])["url"]
 
-async def check_plugin(name: str, loader: Loader) -> bool:
-    """True if successful."""
-    url = get_latest_file(name, loader)
-    if url is None:
-        print(f"No {loader} file found for {name}")
-        return False
 
+async def fetch_file(
+    url: str,
+    tars: list[pathlib.PosixPath],
+    breaker: CircuitBreaker,
+) -> bool:
+    """Download url once and link it into every target. True if successful."""
     try:
-        p = await asyncio.create_subprocess_exec("wget", "-U", USER_AGENT, "-qN", url)
-        await p.communicate()
-        print(f"Downloaded modrinth {name}")
+        if not await wget(url, tars[0], USER_AGENT, "modrinth", breaker):
+            return False
     except Exception as e:
-        print(f"Error fetching {name}: {e}")
+        print(f"Error fetching {url}: {e}")
         return False
-    else:
-        return True
 
+    jar = tars[0] / urlFilename(url)
+    if jar.is_file():
+        linkInto(jar, tars[1:])
+    return True
+
+
+def check_all(
+    plugins: Iterator[PluginId],
+    db: StateDb,
+    breaker: CircuitBreaker,
+) -> PluginMap:
+    """Updated date of each plugin, looked up by cached project id."""
+    plugins = list(plugins)
+    ids = {db.projectId(p) or p: p for p in plugins}
+    params = {"ids": json.dumps(sorted(ids))}
+    url = "https://api.modrinth.com/v2/projects"
+    with breaker.call(url):
+        response = requests.get(url, params=params, timeout=requestsTimeout("modrinth"))
+        response.raise_for_status()
+    projects = response.json()
 
-def check_all(plugins: Iterator[PluginId]) -> PluginMap:
-    params = {"ids": json.dumps(sorted(plugins))}
-    projects = requests.get(
-        "https://api.modrinth.com/v2/projects",
-        params=params,
-        timeout=5,
-    ).json()
-    return {p["slug"]: p["updated"] for p in projects}
+    dates = {}
+    for p in projects:
+        slug = ids.get(p["id"]) or ids.get(p["slug"]) or p["slug"]
+        db.setProjectId(slug, p["id"])
+        dates[slug] = p["updated"]
+    return dates
 
 
-async def update_all(plugins: PluginMap, loader: Loader) -> tuple[PluginMap, bool]:
-    any_new = False
-    new_dates = check_all(iter(plugins.keys()))
-    for slug, date in plugins.items():
+def plan_updates(
+    plugins: PluginMap,
+    loader: Loader,
+    game_version: str | None,
+    schedule: Schedule,
+    db: StateDb,
+    breaker: CircuitBreaker,
+) -> list[tuple[PluginId, UpdateTime, str]]:
+    """Slug, new date and file url of every plugin that needs a download."""
+    fetch = []
+    due = [slug for slug in plugins if schedule.due("modrinth", slug)]
+    try:
+        new_dates = check_all(iter(due), db, breaker) if due else {}
+    except (HostUnavailable, requests.RequestException) as e:
+        print(f"Error checking modrinth projects: {e}")
+        return []
+
+    for slug in due:
         latest_date = new_dates.get(slug, "")
-        if date == latest_date:
+        if plugins[slug] == latest_date:
             print(f"{slug} is up to date.")
+            schedule.record("modrinth", slug, latest_date)
+            continue
+
+        project = db.projectId(slug) or slug
+        try:
+            url = get_latest_file(project, loader, breaker, game_version)
+        except (HostUnavailable, requests.RequestException) as e:
+            print(f"Error checking {slug}: {e}")
+            continue
+
+        if url is None:
+            print(f"No {loader} file found for {slug}")
             continue
 
-        if await check_plugin(slug, loader):
-            any_new = True
-            plugins[slug] = latest_date
+        fetch.append((slug, latest_date, url))
+
+    return fetch
+
+
+async def fetch_and_record(
+    url: str,
+    entries: list[tuple[pathlib.PosixPath, PluginId, UpdateTime]],
+    dbs: dict[pathlib.PosixPath, StateDb],
+    schedules: dict[pathlib.PosixPath, Schedule],
+    breaker: CircuitBreaker,
+) -> bool:
+    """Download url for every plugin entry, storing each as soon as it lands."""
+    tars = list(dict.fromkeys(t for t, _, _ in entries))
+    if not await fetch_file(url, tars, breaker):
+        return False
+
+    for tar, slug, date in entries:
+        print(f"Downloaded modrinth {slug}")
+        jar = tar / urlFilename(url)
+        if jar.is_file():
+            dbs[tar].recordFile(jar, "modrinth", slug, url)
+        dbs[tar].setVersion("modrinth", slug, date)
+        schedules[tar].record("modrinth", slug, date)
 
-    return plugins, any_new
+    return True
 
 
 async def main() -> None:
-    path, loader = parseArgs()
-    pathlib.os.chdir(path)
+    targets, checkAll = parseArgs()
 
-    try:
-        with pathlib.Path("modrinth.csv").open(encoding="utf-8") as f:
-            plugins = cast(
-                "PluginMap",
-                (
-                    dict(
-                        [
-                            i.split(",")
-                            for i in f.read().splitlines()
-                            if i.count(",") == 1
-                        ],
-                    )
-                ),
-            )
-    except FileNotFoundError:
-        print("modrinth.csv not found in path.")
-        return
-
-    if not plugins:
-        print("No plugins found in modrinth.csv.")
-    plugins, any_new = await update_all(plugins, loader)
-    if not any_new:
-        print("No new updates.")
-        return
-
-    with pathlib.Path("modrinth.csv").open("w") as f:
-        f.writelines(f"{slug},{date}\n" for slug, date in plugins.items())
+    # Plan across every target so shared files are fetched once
+    dbs: dict[pathlib.PosixPath, StateDb] = {}
+    schedules: dict[pathlib.PosixPath, Schedule] = {}
+    urlTargets: dict[str, list[tuple[pathlib.PosixPath, PluginId, UpdateTime]]] = {}
+    breaker: CircuitBreaker | None = None
+    for tar, loader, game_version in targets:
+        db = StateDb(tar)
+        if not db.importConfig("modrinth") and not db.plugins("modrinth"):
+            print(f"modrinth.csv not found in {tar}.")
+            continue
+
+        plugins = cast(
+            "PluginMap",
+            {row["key"]: row["version"] for row in db.plugins("modrinth")},
+        )
+        if not plugins:
+            print("No plugins found in modrinth.csv.")
+        dbs[tar] = db
+        schedules[tar] = Schedule(db, force=checkAll)
+        # Host health is kept in the first target's store
+        breaker = breaker or CircuitBreaker(db, "modrinth")
+        for slug, date, url in plan_updates(
+            plugins,
+            loader,
+            game_version,
+            schedules[tar],
+            db,
+            breaker,
+        ):
+            urlTargets.setdefault(url, []).append((tar, slug, date))
+
+    results = await asyncio.gather(
+        *(
+            fetch_and_record(url, entries, dbs, schedules, breaker)
+            for url, entries in urlTargets.items()
+        ),
+    )
+
+    updated = {
+        tar
+        for ok, entries in zip(results, urlTargets.values(), strict=True)
+        if ok
+        for tar, _, _ in entries
+    }
+    for tar, schedule in schedules.items():
+        schedule.report()
+        if tar not in updated:
+            print(f"No new updates in {tar}.")
+    if breaker is not None:
+        breaker.report()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    profiling.run(main)
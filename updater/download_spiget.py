@@ -4,12 +4,16 @@ import asyncio
 import logging
 import pathlib
 
-from downloadLib import downloadFile, set_cwd, shouldDownload
+import profiling
+from breaker import CircuitBreaker
+from downloadLib import RedirectCache, downloadFile, set_cwd, shouldDownload
+from schedule import Schedule
+from stateDb import StateDb
 
 logger = logging.getLogger(__name__)
 
 
-def parseArgs() -> pathlib.PosixPath:
+def parseArgs() -> tuple[pathlib.PosixPath, bool]:
     parser = argparse.ArgumentParser(
         description="Update local repository using spiget repository.",
     )
@@ -20,39 +24,68 @@ def parseArgs() -> pathlib.PosixPath:
         required=True,
         help="Path to the target directory.",
     )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Check every plugin, even those not due for a check.",
+    )
+
+    args = parser.parse_args()
+    return args.tar.resolve(), args.all
 
-    return parser.parse_args().tar.resolve()
 
+async def checkSpiget(
+    name: str,
+    rid: str,
+    schedule: Schedule,
+    redirects: RedirectCache,
+    db: StateDb,
+    breaker: CircuitBreaker,
+) -> None:
+    if not schedule.due("spiget", rid):
+        return
 
-async def checkSpiget(name: str, rid: str) -> None:
     # May need to cache the id -> Location
     url = f"https://api.spiget.org/v2/resources/{rid}/download"
     try:
         assert rid
         assert int(rid)
         dest = pathlib.PosixPath(f"{name}.jar")
-        if not await shouldDownload(url, dest):
+        if not await shouldDownload(url, dest, redirects, breaker):
             print(f"{name} is up to date.")
-            return
-
-        await downloadFile(url, dest)
-        print(f"Downloaded {name}")
+        else:
+            trueUrl = await downloadFile(url, dest, redirects, breaker)
+            db.recordFile(dest, "spiget", rid, trueUrl)
+            print(f"Downloaded {name}")
     except Exception as e:
         print(f"Error fetching {rid}: {e}")
+    else:
+        # Downloads carry the upstream Last-Modified as mtime
+        lastModified = str(int(dest.stat().st_mtime))
+        db.setVersion("spiget", rid, lastModified)
+        schedule.record("spiget", rid, lastModified)
 
 
 async def main() -> None:
-    set_cwd(parseArgs())
+    tar, checkAll = parseArgs()
+    set_cwd(tar)
 
-    try:
-        with pathlib.Path("spiget.csv").open(encoding="utf-8") as f:
-            args = [i.split(",") for i in f.read().splitlines() if i.count(",") == 1]
-    except FileNotFoundError:
+    db = StateDb(tar)
+    if not db.importConfig("spiget") and not db.plugins("spiget"):
         print("spiget.csv not found in path.")
-    else:
-        assert args
-        await asyncio.gather(*(checkSpiget(*arg) for arg in args))
+        return
+
+    args = [(row["name"], row["key"]) for row in db.plugins("spiget")]
+    assert args
+    schedule = Schedule(db, force=checkAll)
+    redirects = RedirectCache(db)
+    breaker = CircuitBreaker(db, "spiget")
+    await asyncio.gather(
+        *(checkSpiget(*arg, schedule, redirects, db, breaker) for arg in args),
+    )
+    schedule.report()
+    breaker.report()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    profiling.run(main)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import json
+import pathlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict
+
+import profiling
+from history import fileDigest
+from index_plugins import no_dependencies
+from plLib import PluginItem, planPluginDb, pluginItem
+from psync import PluginDb, UpdateGroup, getDelta, groupDelta, updatePlugins
+from updateServerJar import read_servers
+from versions import CustomVersion
+
+
+class VersionInfo(TypedDict):
+    original: str
+    core: str
+    suffix: str
+
+
+class FileInfo(TypedDict):
+    file: str
+    version: VersionInfo
+    size: int
+    mtime: float
+
+
+class PlannedUpdate(TypedDict):
+    artifact: str
+    name: str
+    group: int
+    old: FileInfo
+    new: FileInfo
+    sha256: str
+    bytes: int
+
+
+class SkippedUpdate(TypedDict):
+    artifact: str
+    name: str
+    old: FileInfo
+    new: FileInfo
+    reason: str
+
+
+class ServerPlan(TypedDict):
+    plugins: str
+    error: str | None
+    updates: list[PlannedUpdate]
+    affects: list[list[str]]
+    skipped: list[SkippedUpdate]
+    duplicates: list[dict[str, str | list[str]]]
+    bytes: int
+
+
+class FleetPlan(TypedDict):
+    source: str
+    created: float
+    servers: list[ServerPlan]
+
+
+def versionInfo(version: CustomVersion) -> VersionInfo:
+    return {
+        "original": str(version),
+        "core": str(version.core_version),
+        "suffix": version.suffix,
+    }
+
+
+def fileInfo(pli: PluginItem) -> FileInfo:
+    st = pli["path"].stat()
+    return {
+        "file": pli["path"].name,
+        "version": versionInfo(pli["version"]),
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+    }
+
+
+def planServer(srcdb: PluginDb, plugins: pathlib.PosixPath) -> ServerPlan:
+    """What psync would do to one plugins folder, without changing it.
+
+    Update hashes are left empty for planFleet to fill in.
+    """
+    if not plugins.is_dir():
+        print(f"Plugins folder {plugins} not found")
+        return {
+            "plugins": str(plugins),
+            "error": "plugins folder not found",
+            "updates": [],
+            "affects": [],
+            "skipped": [],
+            "duplicates": [],
+            "bytes": 0,
+        }
+
+    try:
+        tardb, dedup = planPluginDb(plugins)
+    except FileNotFoundError as e:
+        print(e)
+        tardb, dedup = {}, []
+
+    delta = []
+    skipped: list[SkippedUpdate] = []
+    for srcPlugin, tarPlugin in getDelta(srcdb, tardb, skip_major=False):
+        if srcPlugin["version"].is_major_upgrade(tarPlugin["version"]):
+            skipped.append(
+                {
+                    "artifact": srcPlugin["artifact"],
+                    "name": tarPlugin["deps"]["name"],
+                    "old": fileInfo(tarPlugin),
+                    "new": fileInfo(srcPlugin),
+                    "reason": "major upgrade",
+                },
+            )
+        else:
+            delta.append((srcPlugin, tarPlugin))
+
+    updates: list[PlannedUpdate] = []
+    affects = []
+    for i, (group, affected) in enumerate(groupDelta(srcdb, tardb, iter(delta))):
+        affects.append(sorted(affected))
+        for srcPlugin, tarPlugin in group:
+            new = fileInfo(srcPlugin)
+            updates.append(
+                {
+                    "artifact": srcPlugin["artifact"],
+                    "name": tarPlugin["deps"]["name"],
+                    "group": i,
+                    "old": fileInfo(tarPlugin),
+                    "new": new,
+                    "sha256": "",
+                    "bytes": new["size"],
+                },
+            )
+
+    return {
+        "plugins": str(plugins),
+        "error": None,
+        "updates": updates,
+        "affects": affects,
+        "skipped": skipped,
+        "duplicates": [
+            {
+                "keep": action["keep"]["path"].name,
+                "delete": [older["path"].name for older in action["delete"]],
+            }
+            for action in dedup
+        ],
+        "bytes": sum(update["bytes"] for update in updates),
+    }
+
+
+def planFleet(src: pathlib.PosixPath, servers: list[pathlib.PosixPath]) -> FleetPlan:
+    """Index the source once and plan every server concurrently."""
+    srcdb, _ = planPluginDb(src)
+    with ThreadPoolExecutor() as pool:
+        plans = list(pool.map(lambda p: planServer(srcdb, p), servers))
+
+        # Hashed so the plan can later be checked against the source
+        names = sorted({u["new"]["file"] for plan in plans for u in plan["updates"]})
+        digests = dict(
+            zip(names, pool.map(fileDigest, (src / n for n in names)), strict=True)
+        )
+
+    for plan in plans:
+        for update in plan["updates"]:
+            update["sha256"] = digests[update["new"]["file"]]
+
+    return {"source": str(src), "created": time.time(), "servers": plans}
+
+
+def _unchanged(path: pathlib.PosixPath, info: FileInfo) -> bool:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return False
+    return st.st_size == info["size"] and st.st_mtime == info["mtime"]
+
+
+def _sourceMatches(path: pathlib.PosixPath, update: PlannedUpdate) -> bool:
+    if _unchanged(path, update["new"]):
+        return True
+    try:
+        return fileDigest(path) == update["sha256"]
+    except FileNotFoundError:
+        return False
+
+
+def _item(path: pathlib.PosixPath, update: PlannedUpdate, info: FileInfo) -> PluginItem:
+    deps = no_dependencies(update["name"])
+    return pluginItem(path, update["artifact"], info["version"]["original"], deps)
+
+
+def applyFleetPlan(plan: FleetPlan, autoyes: bool) -> int:
+    """Apply a plan as written, skipping groups whose files changed since."""
+    src = pathlib.PosixPath(plan["source"])
+    applied = 0
+    for server in plan["servers"]:
+        plugins = pathlib.PosixPath(server["plugins"])
+        groups: dict[int, UpdateGroup] = {}
+        stale = set()
+        for update in server["updates"]:
+            srcPath = src / update["new"]["file"]
+            tarPath = plugins / update["old"]["file"]
+            if not _unchanged(tarPath, update["old"]) or not _sourceMatches(
+                srcPath,
+                update,
+            ):
+                print(f"Plan is out of date for {tarPath}")
+                stale.add(update["group"])
+
+            groups.setdefault(update["group"], []).append(
+                (
+                    _item(srcPath, update, update["new"]),
+                    _item(tarPath, update, update["old"]),
+                ),
+            )
+
+        todo = [
+            (group, set(server["affects"][i]))
+            for i, group in groups.items()
+            if i not in stale
+        ]
+        updates = updatePlugins(todo, dryrun=False, autoyes=autoyes)
+        if updates:
+            print(f"Completed {len(updates)} plugin updates for {plugins.parent.name}.")
+        applied += len(updates)
+
+    return applied
+
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Plan plugin updates for many servers at once, or apply a plan.",
+    )
+    actions = parser.add_subparsers(dest="action", required=True)
+
+    plan = actions.add_parser("plan", help="Write a JSON update plan.")
+    plan.add_argument(
+        "--src",
+        type=pathlib.PosixPath,
+        required=True,
+        help="Path to the source directory.",
+    )
+    plan.add_argument(
+        "--tar",
+        type=pathlib.PosixPath,
+        action="append",
+        default=[],
+        help="Server plugins folder. Repeat for every server.",
+    )
+    plan.add_argument(
+        "--servers",
+        type=pathlib.PosixPath,
+        help='File of "type version path" lines, as used by updateServerJar.py.',
+    )
+    plan.add_argument(
+        "-o",
+        dest="output",
+        type=pathlib.PosixPath,
+        help="Write the plan to this file instead of stdout.",
+    )
+
+    apply = actions.add_parser("apply", help="Apply a plan written earlier.")
+    apply.add_argument("plan", type=pathlib.PosixPath, help="Plan file.")
+    apply.add_argument(
+        "-y",
+        action="store_true",
+        help="Confirm operation without prompting.",
+    )
+
+    args = parser.parse_args()
+    if args.action == "plan" and not args.tar and args.servers is None:
+        parser.error("Give server plugins folders with --tar or --servers.")
+
+    return args
+
+
+def main() -> None:
+    args = parseArgs()
+
+    if args.action == "apply":
+        plan = json.loads(args.plan.read_text(encoding="utf-8"))
+        if not applyFleetPlan(plan, args.y):
+            print("[PSYNC] No updates done.")
+        return
+
+    servers = [tar.resolve() for tar in args.tar]
+    if args.servers is not None:
+        servers += [path / "plugins" for _, _, path in read_servers(args.servers)]
+
+    # Keep stdout for the plan
+    with contextlib.redirect_stdout(sys.stderr):
+        plan = planFleet(args.src.resolve(), list(dict.fromkeys(servers)))
+
+    text = json.dumps(plan, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        args.output.write_text(text + "\n", encoding="utf-8")
+
+    total = sum(server["bytes"] for server in plan["servers"])
+    count = sum(len(server["updates"]) for server in plan["servers"])
+    print(
+        f"Planned {count} updates on {len(plan['servers'])} servers, {total} bytes to copy.",
+        file=sys.stderr,
+    )
+    if any(server["error"] for server in plan["servers"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
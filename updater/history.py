@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import argparse
+import atexit
+import hashlib
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+
+import zstandard
+
+HISTORY_DIR = pathlib.PosixPath(
+    os.environ.get("UPDATER_HISTORY_DIR", "~/.cache/plugin-history"),
+).expanduser()
+
+# Superseded copies are kept until either bound is hit, oldest first
+MAX_BYTES = 2 * 1024**3
+MAX_AGE = 90 * 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    stored INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    folder TEXT NOT NULL,
+    file TEXT NOT NULL,
+    artifact TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    removed REAL NOT NULL,
+    rolled_back INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (folder, file, sha256)
+);
+"""
+
+
+def fileDigest(path: pathlib.Path) -> str:
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class History:
+    """Deduplicated, zstd-compressed store of superseded JARs.
+
+    Files are stored once by content hash, each folder a copy was removed
+    from is recorded so it can be restored there. Shared with worker
+    threads, so every access holds the lock. Trimmed once per run, by trim().
+    """
+
+    def __init__(self, root: pathlib.PosixPath = HISTORY_DIR) -> None:
+        root.mkdir(parents=True, exist_ok=True)
+        self.root = root
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(root / "history.db", check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.archived = False
+
+    def _object(self, sha256: str) -> pathlib.PosixPath:
+        return self.root / "objects" / sha256[:2] / f"{sha256}.zst"
+
+    def archive(
+        self,
+        path: pathlib.PosixPath,
+        artifact: str,
+        name: str,
+        version: str,
+        rolledBack: bool = False,
+    ) -> None:
+        """Store a copy of a file about to be deleted from its folder.
+
+        rolledBack marks a copy swapped out by a rollback, which later
+        rollbacks go past.
+        """
+        st = path.stat()
+        sha256 = fileDigest(path)
+        obj = self._object(sha256)
+        if not obj.is_file():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            tmp = obj.with_name(f".{obj.name}.{threading.get_ident()}")
+            with path.open("rb") as src, tmp.open("wb") as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+            tmp.replace(obj)
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO objects VALUES (?, ?, ?)",
+                (sha256, st.st_size, obj.stat().st_size),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(path.parent),
+                    path.name,
+                    artifact,
+                    name,
+                    version,
+                    sha256,
+                    st.st_mtime,
+                    time.time(),
+                    rolledBack,
+                ),
+            )
+            self.archived = True
+
+    def remove(
+        self,
+        path: pathlib.PosixPath,
+        artifact: str,
+        name: str,
+        version: str,
+        rolledBack: bool = False,
+    ) -> None:
+        self.archive(path, artifact, name, version, rolledBack)
+        path.unlink()
+
+    def previous(
+        self,
+        folder: pathlib.PosixPath,
+        artifact: str,
+        exclude: set[str],
+    ) -> sqlite3.Row | None:
+        """Most recently removed copy of artifact in folder not among exclude.
+
+        Copies a rollback swapped out are skipped, so rolling back again
+        goes back another version.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT * FROM versions WHERE folder = ?
+                AND (artifact = ? OR lower(name) = lower(?)) AND NOT rolled_back
+                ORDER BY removed DESC""",
+                (str(folder), artifact, artifact),
+            ).fetchall()
+        return next((row for row in rows if row["sha256"] not in exclude), None)
+
+    def folders(self, artifact: str) -> list[pathlib.PosixPath]:
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT DISTINCT folder FROM versions
+                WHERE artifact = ? OR lower(name) = lower(?) ORDER BY folder""",
+                (artifact, artifact),
+            ).fetchall()
+        return [pathlib.PosixPath(row["folder"]) for row in rows]
+
+    def entries(self, artifact: str | None = None) -> list[sqlite3.Row]:
+        with self.lock:
+            return self.conn.execute(
+                """SELECT * FROM versions
+                WHERE ? IS NULL OR artifact = ? OR lower(name) = lower(?)
+                ORDER BY folder, artifact, removed""",
+                (artifact, artifact, artifact),
+            ).fetchall()
+
+    def restore(self, entry: sqlite3.Row) -> pathlib.PosixPath:
+        """Put a stored copy back into its folder with its original mtime."""
+        dest = pathlib.PosixPath(entry["folder"]) / entry["file"]
+        tmp = dest.with_name(f".{dest.name}.restore")
+        with self._object(entry["sha256"]).open("rb") as src, tmp.open("wb") as dst:
+            zstandard.ZstdDecompressor().copy_stream(src, dst)
+        os.utime(tmp, (entry["mtime"], entry["mtime"]))
+        tmp.replace(dest)
+        return dest
+
+    def evict(self, maxBytes: int = MAX_BYTES, maxAge: float = MAX_AGE) -> int:
+        """Drop copies older than maxAge, then the oldest until under maxBytes."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM versions WHERE removed < ?",
+                (time.time() - maxAge,),
+            )
+            objects = self.conn.execute(
+                """SELECT o.sha256, o.stored, max(v.removed) AS removed
+                FROM objects o LEFT JOIN versions v USING (sha256)
+                GROUP BY o.sha256 ORDER BY removed""",
+            ).fetchall()
+
+            total = sum(o["stored"] for o in objects)
+            evicted = []
+            for o in objects:
+                if o["removed"] is not None and total <= maxBytes:
+                    break
+                total -= o["stored"]
+                evicted.append(o["sha256"])
+
+            for sha256 in evicted:
+                self.conn.execute("DELETE FROM versions WHERE sha256 = ?", (sha256,))
+                self.conn.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+
+        for sha256 in evicted:
+            self._object(sha256).unlink(missing_ok=True)
+        return len(evicted)
+
+    def trim(self) -> None:
+        """Evict with the default bounds if this run stored anything."""
+        if self.archived:
+            self.archived = False
+            self.evict()
+
+
+_default: History | None = None
+_defaultLock = threading.Lock()
+
+
+def defaultHistory() -> History:
+    """History shared by the whole process, trimmed when it exits."""
+    global _default
+    with _defaultLock:
+        if _default is None:
+            _default = History()
+            atexit.register(_default.trim)
+        return _default
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Inspect or trim the store of superseded JARs.",
+    )
+    parser.add_argument("action", choices=["list", "evict"])
+    parser.add_argument("artifact", nargs="?", help="Only list this artifact.")
+    parser.add_argument(
+        "--max-size",
+        type=int,
+        default=MAX_BYTES // 1024**2,
+        help="Size bound in MiB.",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=MAX_AGE / (24 * 60 * 60),
+        help="Age bound in days.",
+    )
+    args = parser.parse_args()
+
+    history = defaultHistory()
+    if args.action == "evict":
+        count = history.evict(args.max_size * 1024**2, args.max_age * 24 * 60 * 60)
+        print(f"Evicted {count} stored files.")
+        return
+
+    for entry in history.entries(args.artifact):
+        removed = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["removed"]))
+        print(f"{entry['folder']}/{entry['file']} {entry['version']} removed {removed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,242 @@
 import argparse
 import json
 import pathlib
+import re
+from collections import Counter
 from collections.abc import Generator
-from zipfile import ZipFile
+from functools import lru_cache
+from typing import TypedDict
+from zipfile import BadZipFile, ZipFile
 
-PluginGen = Generator[tuple[pathlib.PosixPath, str, str]]
+from ruamel.yaml import YAML, YAMLError
 
 
-def get_prop(contents: str, is_yml: bool, prop: str) -> str:
-    if is_yml:
-        prefix = f"{prop}: "
-        for line in contents.splitlines():
-            if line.startswith(prefix):
-                return line.split(prefix)[-1].strip("'").strip('"')
-    else:
-        return json.loads(contents)[prop]
+class PluginDeps(TypedDict):
+    """Plugin name and the names it declares load-order relations with."""
+
+    name: str
+    depend: frozenset[str]
+    softdepend: frozenset[str]
+    loadbefore: frozenset[str]
+
+
+PluginGen = Generator[tuple[pathlib.PosixPath, str, str, PluginDeps]]
+
+Descriptor = dict[str, object]
+
+# Only used when the line scanner below cannot resolve a descriptor
+_yaml = YAML(typ="safe", pure=False)
+parse_stats: Counter[str] = Counter()
+
+_LIST_KEYS = ("depend", "softdepend", "loadbefore")
+
+# What reading a JAR's descriptor raises for a broken or odd file
+DESCRIPTOR_ERRORS = (BadZipFile, OSError, ValueError, TypeError, YAMLError)
+_SCALAR_KEYS = ("name", "main", "version")
+
+
+def _scalar(value: str) -> str | None:
+    """Plain or quoted YAML scalar, None for anything the scanner can't read."""
+    value = value.strip()
+    if value[:1] in ("'", '"'):
+        end = value.find(value[0], 1)
+        rest = value[end + 1 :].strip() if end != -1 else ""
+        if end == -1 or "\\" in value[:end] or (rest and not rest.startswith("#")):
+            return None
+        return value[1:end]
+
+    value = value.split(" #", 1)[0].strip()
+    if not value or value[0] in "&*!|>{[%@`":
+        return None
+    return value
+
+
+def _scan_yml(contents: str) -> Descriptor | None:
+    """Resolve the top-level keys we need without a YAML parser.
+
+    Returns None when the document uses a form the scanner does not handle,
+    or one YAML would reject, such as tabs or duplicate keys.
+    """
+    if "\t" in contents:
+        return None
+
+    doc: Descriptor = {}
+    seen: set[str] = set()
+    listKey = None
+    for line in contents.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#") or stripped in ("---", "..."):
+            continue
+
+        if line[0] in " \t-":
+            if listKey is None:
+                continue  # Nested content of a key we don't read
+            if not stripped.startswith("- "):
+                return None
+            item = _scalar(stripped[2:])
+            if item is None:
+                return None
+            doc[listKey].append(item)
+            continue
+
+        listKey = None
+        key, sep, value = line.partition(":")
+        # Paper dependencies are nested maps, repeated keys are a YAML error
+        if not sep or key == "dependencies" or key in seen:
+            return None
+        seen.add(key)
+        if key not in _SCALAR_KEYS and key not in _LIST_KEYS:
+            continue
+
+        value = value.strip()
+        if value[:1] not in ("'", '"'):
+            value = value.split(" #", 1)[0].strip()
+
+        if not value:
+            if key not in _LIST_KEYS:
+                return None
+            doc[key] = []
+            listKey = key
+        elif key in _LIST_KEYS and value.startswith("["):
+            if not value.endswith("]"):
+                return None
+            items = [_scalar(i) for i in value[1:-1].split(",") if i.strip()]
+            if None in items:
+                return None
+            doc[key] = items
+        else:
+            doc[key] = _scalar(value)
+            if doc[key] is None:
+                return None
+
+    if "main" not in doc or "version" not in doc:
+        return None
+    return doc
+
+
+def _raw_scalar(contents: str, key: str) -> str | None:
+    """Source text of the least indented plain scalar stored under key."""
+    pattern = rf"^([ \t]*)['\"]?{key}['\"]?[ \t]*:[ \t]*(?:[&!]\S+[ \t]+)*([^\s#]+)"
+    found = re.findall(pattern, contents, re.MULTILINE)
+    if not found:
+        return None
+    return min(found, key=lambda m: len(m[0]))[1]
+
+
+def _load_yml(contents: str) -> Descriptor:
+    doc = _yaml.load(contents) or {}
+    if not isinstance(doc, dict):
+        msg = "Descriptor is not a mapping"
+        raise TypeError(msg)
+
+    # Keep the text of typed scalars, e.g. version: 1.10 is not 1.1
+    for key in _SCALAR_KEYS:
+        if doc.get(key) is None:
+            doc.pop(key, None)
+        elif not isinstance(doc[key], str):
+            doc[key] = _raw_scalar(contents, key) or str(doc[key])
+
+    return doc
+
 
-    raise ValueError
+def parse_descriptor(contents: str, is_yml: bool) -> Descriptor:
+    try:
+        if not is_yml:
+            parse_stats["json"] += 1
+            return json.loads(contents)
+
+        doc = _scan_yml(contents)
+        if doc is not None:
+            parse_stats["fast"] += 1
+            return doc
+
+        parse_stats["yaml"] += 1
+        return _load_yml(contents)
+    except (ValueError, TypeError, YAMLError):
+        parse_stats["failed"] += 1
+        raise
+
+
+@lru_cache(maxsize=4096)
+def _read_descriptor(
+    path: str,
+    inode: int,
+    size: int,
+    mtime_ns: int,
+) -> tuple[Descriptor, bool]:
+    text, is_yml = read_plugin_yml(pathlib.PosixPath(path))
+    return parse_descriptor(text, is_yml), is_yml
+
+
+def read_descriptor(jar_file: pathlib.PosixPath) -> tuple[Descriptor, bool]:
+    """Parsed descriptor of a JAR, cached while the file is unchanged."""
+    st = jar_file.stat()
+    return _read_descriptor(str(jar_file), st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def format_parse_stats() -> str:
+    hits = _read_descriptor.cache_info().hits
+    counts = ", ".join(f"{n} {kind}" for kind, n in sorted(parse_stats.items()))
+    return f"Descriptors parsed: {counts or 'none'}; {hits} cached"
+
+
+def get_prop(doc: Descriptor, prop: str) -> str:
+    return str(doc[prop])
+
+
+def _names(value: object) -> frozenset[str]:
+    if not value:
+        return frozenset()
+    if isinstance(value, str):
+        return frozenset((value,))
+    return frozenset(str(v) for v in value)
+
+
+def no_dependencies(name: str = "") -> PluginDeps:
+    return {
+        "name": name,
+        "depend": frozenset(),
+        "softdepend": frozenset(),
+        "loadbefore": frozenset(),
+    }
+
+
+def get_dependencies(doc: Descriptor, is_yml: bool) -> PluginDeps:
+    """Read depend, softdepend and loadbefore from any descriptor format.
+
+    Paper and Velocity declarations are mapped onto the Bukkit keys.
+    """
+    if not is_yml:
+        deps = doc.get("dependencies") or []
+        return {
+            "name": doc.get("id", ""),
+            "depend": frozenset(d["id"] for d in deps if not d.get("optional")),
+            "softdepend": frozenset(d["id"] for d in deps if d.get("optional")),
+            "loadbefore": frozenset(),
+        }
+
+    depend = set(_names(doc.get("depend")))
+    softdepend = set(_names(doc.get("softdepend")))
+    loadbefore = set(_names(doc.get("loadbefore")))
+
+    # paper-plugin.yml: dependencies -> {bootstrap,server} -> name -> options
+    phases = doc.get("dependencies")
+    for phase in phases.values() if isinstance(phases, dict) else ():
+        for dep, opts in (phase or {}).items():
+            opts = opts or {}
+            if str(opts.get("load", "OMIT")).upper() == "AFTER":
+                loadbefore.add(dep)
+            elif opts.get("required", True):
+                depend.add(dep)
+            else:
+                softdepend.add(dep)
+
+    return {
+        "name": str(doc.get("name", "")),
+        "depend": frozenset(depend),
+        "softdepend": frozenset(softdepend),
+        "loadbefore": frozenset(loadbefore),
+    }
 
 
 def read_plugin_yml(jar_file: pathlib.PosixPath) -> tuple[str, bool]:
@@ -33,6 +253,27 @@ def read_plugin_yml(jar_file: pathlib.PosixPath) -> tuple[str, bool]:
     raise FileNotFoundError
 
 
+def index_plugin(jar_file: pathlib.PosixPath) -> tuple[str, str, PluginDeps] | None:
+    """Artifact, version and dependencies of one JAR, None if unreadable."""
+    try:
+        doc, is_yml = read_descriptor(jar_file)
+        artifact = get_prop(doc, "main")
+        version = get_prop(doc, "version")
+        try:
+            deps = get_dependencies(doc, is_yml)
+        except (AttributeError, KeyError, TypeError) as e:
+            print(f"Could not read dependencies of {jar_file}: {e}")
+            deps = no_dependencies()
+    except (KeyError, FileNotFoundError):
+        print(f"plugin.yml paper-plugin.yml not found in {jar_file}")
+    except DESCRIPTOR_ERRORS as e:
+        print(f"An error occurred with {jar_file}: {e}")
+    else:
+        return artifact, version, deps
+
+    return None
+
+
 def index_plugins(folder: pathlib.PosixPath) -> PluginGen:
     """Extracts and prints the contents of plugin.yml from each .jar file provided.
 
@@ -41,15 +282,12 @@ def index_plugins(folder: pathlib.PosixPath) -> PluginGen:
     assert folder.is_dir()
 
     for jar_file in sorted(folder.glob("*jar")):
-        try:
-            text, is_yml = read_plugin_yml(jar_file)
-            artifact = get_prop(text, is_yml, "main")
-            version = get_prop(text, is_yml, "version")
-            yield jar_file, artifact, version
-        except (KeyError, FileNotFoundError):
-            print(f"plugin.yml paper-plugin.yml not found in {jar_file}")
-        except Exception as e:
-            print(f"An error occurred with {jar_file}: {e}")
+        entry = index_plugin(jar_file)
+        if entry is not None:
+            yield jar_file, *entry
+
+    if parse_stats["failed"]:
+        print(format_parse_stats())
 
 
 def main() -> None:
@@ -58,8 +296,9 @@ def main() -> None:
     directory = parser.parse_args().path
 
     gen = index_plugins(directory)
-    for jar, artifact, version in gen:
-        print(jar, artifact, version)
+    for jar, artifact, version, deps in gen:
+        print(jar, artifact, version, *sorted(deps["depend"] | deps["softdepend"]))
+    print(format_parse_stats())
 
 
 if __name__ == "__main__":
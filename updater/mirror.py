@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+from typing import TypedDict
+from urllib.parse import urlsplit
+
+import aiohttp
+import profiling
+from aiohttp import web
+from history import fileDigest
+from plLib import getPluginDb
+
+DEFAULT_CACHE = pathlib.PosixPath("~/.cache/plugin-mirror").expanduser()
+PARALLEL_DOWNLOADS = 8
+
+
+class MirrorEntry(TypedDict):
+    artifact: str
+    version: str
+    file: str
+    sha256: str
+    size: int
+    mtime: float
+
+
+class MirrorFolder:
+    """JSON index of a pruned plugin database, rebuilt when the folder changes."""
+
+    def __init__(self, folder: pathlib.PosixPath) -> None:
+        self.folder = folder
+        self.snapshot: frozenset[tuple[str, int, int]] = frozenset()
+        self.digests: dict[tuple[str, int, int], str] = {}
+        self.entries: dict[str, MirrorEntry] = {}
+        self.body = b""
+        self.etag = ""
+
+    def _snapshot(self) -> frozenset[tuple[str, int, int]]:
+        snapshot = set()
+        for path in self.folder.glob("*jar"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot.add((path.name, st.st_size, st.st_mtime_ns))
+        return frozenset(snapshot)
+
+    def refresh(self) -> None:
+        snapshot = self._snapshot()
+        if snapshot == self.snapshot and self.body:
+            return
+
+        stats = {name: (name, size, mtime) for name, size, mtime in snapshot}
+        entries = {}
+        try:
+            plugindb = getPluginDb(self.folder, None, False)
+        except FileNotFoundError:
+            plugindb = {}
+
+        for artifact, pli in plugindb.items():
+            key = stats.get(pli["path"].name)
+            if key is None:
+                continue
+            if key not in self.digests:
+                self.digests[key] = fileDigest(pli["path"])
+            entries[pli["path"].name] = {
+                "artifact": artifact,
+                "version": str(pli["version"]),
+                "file": pli["path"].name,
+                "sha256": self.digests[key],
+                "size": key[1],
+                "mtime": key[2] / 1e9,
+            }
+
+        self.digests = {k: v for k, v in self.digests.items() if k in snapshot}
+        self.snapshot = snapshot
+        self.entries = entries
+        self.body = json.dumps(
+            sorted(entries.values(), key=lambda e: e["file"])
+        ).encode()
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()}"'
+
+
+def _notModified(request: web.Request, etag: str) -> bool:
+    return any(tag.value == etag.strip('"') for tag in request.if_none_match or ())
+
+
+def makeApp(folders: list[pathlib.PosixPath]) -> web.Application:
+    mirrors = {folder.name: MirrorFolder(folder) for folder in folders}
+    lock = asyncio.Lock()
+
+    async def current(name: str) -> MirrorFolder:
+        if name not in mirrors:
+            raise web.HTTPNotFound
+        async with lock:
+            await asyncio.to_thread(mirrors[name].refresh)
+        return mirrors[name]
+
+    async def index(request: web.Request) -> web.StreamResponse:
+        mirror = await current(request.match_info["db"])
+        if _notModified(request, mirror.etag):
+            return web.Response(status=304, headers={"ETag": mirror.etag})
+        return web.Response(
+            body=mirror.body,
+            content_type="application/json",
+            headers={"ETag": mirror.etag},
+        )
+
+    async def download(request: web.Request) -> web.StreamResponse:
+        mirror = await current(request.match_info["db"])
+        # Only indexed files are served
+        entry = mirror.entries.get(request.match_info["file"])
+        if entry is None:
+            raise web.HTTPNotFound
+
+        etag = f'"{entry["sha256"]}"'
+        if _notModified(request, etag):
+            return web.Response(status=304, headers={"ETag": etag})
+
+        request["etag"] = etag
+        return web.FileResponse(
+            mirror.folder / entry["file"],
+            headers={"Content-Type": "application/java-archive"},
+        )
+
+    async def tagContent(request: web.Request, response: web.StreamResponse) -> None:
+        # FileResponse tags files by mtime and size, clients compare hashes
+        if "etag" in request:
+            response.headers["ETag"] = request["etag"]
+
+    app = web.Application()
+    app.on_response_prepare.append(tagContent)
+    app.router.add_get("/{db}/index.json", index)
+    app.router.add_get("/{db}/files/{file}", download)
+    return app
+
+
+class _CacheState(TypedDict):
+    etag: str
+    entries: list[MirrorEntry]
+
+
+def _readState(path: pathlib.PosixPath) -> _CacheState:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"etag": "", "entries": []}
+
+
+async def _fetchFile(
+    session: aiohttp.ClientSession,
+    url: str,
+    entry: MirrorEntry,
+    dest: pathlib.PosixPath,
+    known: dict[str, MirrorEntry],
+) -> bool:
+    """Fetch one file unless the cached copy already has its hash.
+
+    False if it could not be fetched, leaving any cached copy in place.
+    """
+    path = dest / entry["file"]
+    cached = known.get(entry["file"])
+    headers = {}
+    if path.exists() and cached is not None:
+        if cached["sha256"] == entry["sha256"]:
+            return True
+        headers["If-None-Match"] = f'"{cached["sha256"]}"'
+
+    try:
+        async with session.get(
+            f"{url}/files/{entry['file']}", headers=headers
+        ) as response:
+            if response.status == 304:
+                return True
+            response.raise_for_status()
+            body = await response.read()
+    except aiohttp.ClientError as e:
+        print(f"Failed to fetch {entry['file']} from {url}: {e}")
+        return False
+
+    # The file changed on the mirror after it was indexed
+    if hashlib.sha256(body).hexdigest() != entry["sha256"]:
+        print(f"Hash mismatch for {entry['file']} from {url}, skipped")
+        return False
+
+    part = path.with_name(f".{path.name}.part")
+    part.write_bytes(body)
+    # Keep the mirror's mtime, psync compares it between equal versions
+    os.utime(part, (entry["mtime"], entry["mtime"]))
+    part.replace(path)
+    print("Fetched", entry["file"], "from mirror")
+    return True
+
+
+async def pullMirror(
+    url: str,
+    cache: pathlib.PosixPath = DEFAULT_CACHE,
+) -> pathlib.PosixPath:
+    """Sync a mirrored database into a local folder and return it."""
+    url = url.rstrip("/")
+    parts = urlsplit(url)
+    dest = (
+        cache / parts.netloc.replace(":", "_") / parts.path.strip("/").replace("/", "_")
+    )
+    dest.mkdir(parents=True, exist_ok=True)
+    statePath = dest / "mirror.json"
+    state = _readState(statePath)
+    known = {entry["file"]: entry for entry in state["entries"]}
+
+    async with aiohttp.ClientSession(raise_for_status=False) as session:
+        headers = {"If-None-Match": state["etag"]} if state["etag"] else {}
+        async with session.get(f"{url}/index.json", headers=headers) as response:
+            if response.status == 304:
+                entries = state["entries"]
+            else:
+                response.raise_for_status()
+                entries = await response.json()
+                state["etag"] = response.headers.get("ETag", "")
+
+        semaphore = asyncio.Semaphore(PARALLEL_DOWNLOADS)
+
+        async def fetch(entry: MirrorEntry) -> bool:
+            async with semaphore:
+                return await _fetchFile(session, url, entry, dest, known)
+
+        fetched = await asyncio.gather(*(fetch(entry) for entry in entries))
+
+    wanted = {entry["file"] for entry in entries}
+    for path in dest.glob("*jar"):
+        if path.name not in wanted:
+            path.unlink()
+
+    # Record what is on disk, skipped files are fetched again next run
+    state["entries"] = []
+    for entry, ok in zip(entries, fetched, strict=True):
+        if ok:
+            state["entries"].append(entry)
+        elif entry["file"] in known:
+            state["entries"].append(known[entry["file"]])
+    if not all(fetched):
+        state["etag"] = ""
+    tmp = statePath.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    tmp.replace(statePath)
+    return dest
+
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Serve pruned plugin databases to other hosts.",
+    )
+
+    parser.add_argument(
+        "--src",
+        type=pathlib.PosixPath,
+        action="append",
+        required=True,
+        help="Plugin database served under its folder name.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on, 0.0.0.0 to serve other hosts.",
+    )
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parseArgs()
+    folders = [src.resolve() for src in args.src]
+    for folder in folders:
+        print(f"Serving {folder} at /{folder.name}/index.json")
+    web.run_app(makeApp(folders), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
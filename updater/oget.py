@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 import argparse
-import asyncio
 import logging
 import pathlib
 
-from downloadLib import downloadFile, shouldDownload
+import profiling
+from breaker import CircuitBreaker, HostUnavailable
+from downloadLib import RedirectCache, downloadFile, shouldDownload
+from stateDb import StateDb
 
 log = logging.getLogger(__name__)
 
@@ -41,12 +43,21 @@ def getLastNumber(url: str) -> int:
 
 async def main() -> None:
     url, dest = parseArgs()
+    db = StateDb(dest.parent)
+    redirects = RedirectCache(db)
+    breaker = CircuitBreaker(db, "url")
 
-    if not await shouldDownload(url, dest):
-        print(f"{dest.stem} is up to date.")
+    try:
+        if not await shouldDownload(url, dest, redirects, breaker):
+            print(f"{dest.stem} is up to date.")
+            return
+
+        trueUrl = await downloadFile(url, dest, redirects, breaker)
+    except HostUnavailable as e:
+        print(e)
         return
+    db.recordFile(dest, "url", url, trueUrl)
 
-    trueUrl = await downloadFile(url, dest)
     print(f"Downloaded {dest.stem} from {trueUrl}")
     try:
         version = getLastNumber(trueUrl)
@@ -56,4 +67,4 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    profiling.run(main)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import pathlib
+import sys
+
+import profiling
+from downloadLib import downloaderCommands
+from plLib import FolderIndex
+from validate import Validator
+from watchfiles import awatch
+
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Download into staging folders, indexing and pruning as files land.",
+    )
+
+    parser.add_argument(
+        "--staging",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("DIR", "LOADER"),
+        help="Staging directory downloaded into, and its modrinth loader.",
+    )
+    parser.add_argument(
+        "--url",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("URL", "DEST"),
+        help="Direct URL downloaded with oget.",
+    )
+
+    return parser.parse_args()
+
+
+async def runDownloader(args: tuple[str, ...]) -> int:
+    p = await asyncio.create_subprocess_exec(sys.executable, *args)
+    await p.communicate()
+    if p.returncode:
+        print(f"Downloader {pathlib.Path(args[0]).name} exited with {p.returncode}")
+    return p.returncode
+
+
+async def watchFolders(
+    indexes: dict[pathlib.PosixPath, FolderIndex],
+    queue: asyncio.Queue[pathlib.PosixPath | None],
+    stop: asyncio.Event,
+) -> None:
+    async for changes in awatch(*indexes, stop_event=stop, debounce=500):
+        for _, name in changes:
+            path = pathlib.PosixPath(name)
+            if path.parent in indexes and path.name.endswith("jar"):
+                queue.put_nowait(path)
+
+
+async def indexWorker(
+    indexes: dict[pathlib.PosixPath, FolderIndex],
+    queue: asyncio.Queue[pathlib.PosixPath | None],
+    validator: Validator,
+) -> None:
+    """Validate landed files in batches, index them and prune what they supersede."""
+    done = False
+    while not done:
+        batch = {await queue.get()}
+        while not queue.empty():
+            batch.add(queue.get_nowait())
+        done = None in batch
+        batch.discard(None)
+
+        for path in await validator.checkAll(sorted(batch)):
+            index = indexes[path.parent]
+            artifact = await asyncio.to_thread(index.update, path)
+            if artifact is not None:
+                await asyncio.to_thread(index.prune, {artifact})
+
+
+async def main() -> None:
+    args = parseArgs()
+    staging = [(pathlib.PosixPath(d).resolve(), loader) for d, loader in args.staging]
+    urls = [(url, pathlib.PosixPath(dest).resolve()) for url, dest in args.url]
+    commands = downloaderCommands(staging, urls)
+
+    folders = {folder for _, written in commands for folder in written}
+    validator = Validator()
+    for folder in folders:
+        await validator.checkAll(sorted(folder.glob("*jar")), settled=True)
+    indexes = {folder: FolderIndex(folder) for folder in folders}
+    queue: asyncio.Queue[pathlib.PosixPath | None] = asyncio.Queue()
+    stop = asyncio.Event()
+
+    watcher = asyncio.create_task(watchFolders(indexes, queue, stop))
+    worker = asyncio.create_task(indexWorker(indexes, queue, validator))
+
+    codes = await asyncio.gather(*(runDownloader(command) for command, _ in commands))
+
+    # Let the watcher flush the last downloads before stopping the worker
+    await asyncio.sleep(1)
+    stop.set()
+    await watcher
+    queue.put_nowait(None)
+    await worker
+
+    # Catch anything that landed before the watcher was up
+    for folder in indexes:
+        await validator.checkAll(sorted(folder.glob("*jar")), settled=True)
+        FolderIndex(folder).prune()
+    validator.close()
+    print("Downloads indexed and pruned.")
+
+    # A failed downloader may have left a staging folder behind, don't mirror it
+    if any(codes):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
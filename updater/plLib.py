@@ -1,25 +1,31 @@
 #!/usr/bin/env python3
+import hashlib
 import pathlib
-from collections.abc import Callable
+from collections import Counter
+from collections.abc import Callable, Iterable
 from typing import TypedDict
 
-from index_plugins import index_plugins
+from history import defaultHistory
+from index_plugins import PluginDeps, index_plugin, index_plugins
 from versions import CustomVersion
 
 
 class PluginItem(TypedDict):
     path: pathlib.PosixPath
+    artifact: str
     version: CustomVersion
+    deps: PluginDeps
 
 
-def _olderPluginFirst(
-    one: PluginItem,
-    two: PluginItem,
-) -> tuple[PluginItem, PluginItem]:
-    if firstMoreRecent(one, two):
-        return two, one
-
-    return one, two
+def retire(pli: PluginItem, rolledBack: bool = False) -> None:
+    """Delete a superseded copy, keeping it in the version history."""
+    defaultHistory().remove(
+        pli["path"],
+        pli["artifact"],
+        pli["deps"]["name"],
+        str(pli["version"]),
+        rolledBack,
+    )
 
 
 def firstMoreRecent(srcPlugin: PluginItem, tarPlugin: PluginItem) -> bool:
@@ -29,48 +35,186 @@ def firstMoreRecent(srcPlugin: PluginItem, tarPlugin: PluginItem) -> bool:
     if srcPlugin["version"] > tarPlugin["version"]:
         return True
 
-    # Otherwise compare metadata and contents
+    # Otherwise the newer copy wins, as in dedup, unless it is the same file
     sp = srcPlugin["path"]
     tp = tarPlugin["path"]
+    sst = sp.stat()
+    tst = tp.stat()
 
-    if sp.stat().st_mtime <= tp.stat().st_mtime:
+    if sst.st_mtime <= tst.st_mtime:
         return False
 
-    if sp.stat().st_size == tp.stat().st_size:
-        return False
+    return sst.st_size != tst.st_size or sp.read_bytes() != tp.read_bytes()
 
-    return sp.read_bytes() != tp.read_bytes()
 
+class DedupAction(TypedDict):
+    """Keep the newest copy of an artifact and delete the others."""
+
+    keep: PluginItem
+    delete: list[PluginItem]
+
+
+def _sortKeys(group: list[PluginItem]) -> list[tuple]:
+    """Version, mtime and size of each copy, plus a digest to break exact ties.
+
+    Of equal versions the newer file wins, as in firstMoreRecent.
+    """
+    keys = []
+    for pli in group:
+        st = pli["path"].stat()
+        keys.append((pli["version"].sort_key(), st.st_mtime, st.st_size))
+
+    counts = Counter(keys)
+    digests = [""] * len(group)
+    for i, key in enumerate(keys):
+        if counts[key] > 1:
+            with group[i]["path"].open("rb") as f:
+                digests[i] = hashlib.file_digest(f, "sha256").hexdigest()
+
+    return [(*key, digest) for key, digest in zip(keys, digests, strict=True)]
+
+
+def pluginItem(
+    path: pathlib.PosixPath,
+    artifact: str,
+    ymlVersion: str,
+    deps: PluginDeps,
+) -> PluginItem:
+    # More edge cases to work on
+    version = CustomVersion(ymlVersion)
+    return {"path": path, "artifact": artifact, "version": version, "deps": deps}
+
+
+def planItems(
+    items: Iterable[PluginItem],
+) -> tuple[dict[str, PluginItem], list[DedupAction]]:
+    """Pick the newest copy of each artifact and plan deleting the others."""
+    groups: dict[str, list[PluginItem]] = {}
+    for pli in items:
+        groups.setdefault(pli["artifact"], []).append(pli)
 
-def getPluginDb(
-    plPath: pathlib.PosixPath,
-    promptDelete: None | Callable[[PluginItem, PluginItem], None],
-    autoDeleteOld: bool,
-) -> dict[str, PluginItem]:
     plugindb = {}
-    for path, artifact, ymlVersion in index_plugins(plPath):
-        # More edge cases to work on
-        version = CustomVersion(ymlVersion)
-        pli: PluginItem = {"path": path, "version": version}
-        # Deduplicate
-        if artifact in plugindb:
-            older, newer = _olderPluginFirst(plugindb[artifact], pli)
-            if autoDeleteOld:
-                print(
-                    f"Deleted old version: {older['path']} {older['version']} Kept: {newer['path']} {newer['version']}",
-                )
-                older["path"].unlink()
-            elif promptDelete:
-                promptDelete(older, newer)
+    plan: list[DedupAction] = []
+    for artifact, group in groups.items():
+        if len(group) > 1:
+            keys = _sortKeys(group)
+            group = [group[i] for i in sorted(range(len(group)), key=keys.__getitem__)]
+            plan.append({"keep": group[-1], "delete": group[:-1]})
 
-            plugindb[artifact] = newer  # Always store newer
-        else:
-            plugindb[artifact] = pli
+        plugindb[artifact] = group[-1]  # Always store newer
 
+    return plugindb, plan
+
+
+def planPluginDb(
+    plPath: pathlib.PosixPath,
+) -> tuple[dict[str, PluginItem], list[DedupAction]]:
+    """Index a folder and plan which duplicate artifacts to delete."""
+    plugindb, plan = planItems(pluginItem(*entry) for entry in index_plugins(plPath))
     if not plugindb:
         msg = f"No plugins found in {plPath}"
         raise FileNotFoundError(msg)
 
+    return plugindb, plan
+
+
+def printPlan(plan: list[DedupAction]) -> None:
+    for action in plan:
+        newer = action["keep"]
+        for older in action["delete"]:
+            print(
+                f"Would delete old version: {older['path']} {older['version']} Keep: {newer['path']} {newer['version']}",
+            )
+
+
+def applyPlan(
+    plan: list[DedupAction],
+    promptDelete: None | Callable[[PluginItem, PluginItem], None],
+    autoDeleteOld: bool,
+    keepHistory: bool = True,
+) -> None:
+    if not autoDeleteOld:
+        if promptDelete:
+            for action in plan:
+                for older in action["delete"]:
+                    promptDelete(older, action["keep"])
+        return
+
+    for action in plan:
+        newer = action["keep"]
+        for older in action["delete"]:
+            print(
+                f"Deleted old version: {older['path']} {older['version']} Kept: {newer['path']} {newer['version']}",
+            )
+
+    for action in plan:
+        for older in action["delete"]:
+            if keepHistory:
+                retire(older)
+            else:
+                older["path"].unlink()
+
+
+class FolderIndex:
+    """In-memory plugin index of one staging folder, updated file by file.
+
+    Copies pruned from it are deleted outright, rollbacks only restore
+    into servers.
+    """
+
+    def __init__(self, folder: pathlib.PosixPath) -> None:
+        self.folder = folder
+        self.items: dict[pathlib.PosixPath, PluginItem] = {}
+        for jar_file in sorted(folder.glob("*jar")):
+            self.update(jar_file)
+
+    def update(self, jar_file: pathlib.PosixPath) -> str | None:
+        """Re-read one file, returning its artifact if it is a plugin."""
+        self.items.pop(jar_file, None)
+        if not jar_file.is_file():
+            return None
+
+        entry = index_plugin(jar_file)
+        if entry is None:
+            return None
+
+        self.items[jar_file] = pluginItem(jar_file, *entry)
+        return entry[0]
+
+    def db(self) -> dict[str, PluginItem]:
+        return planItems(self.items.values())[0]
+
+    def prune(self, artifacts: set[str] | None = None) -> None:
+        """Delete superseded copies, of the given artifacts or of all.
+
+        Files deleted behind the index's back are dropped from it first.
+        """
+        for path in [path for path in self.items if not path.is_file()]:
+            del self.items[path]
+
+        try:
+            _, plan = planItems(
+                pli
+                for pli in self.items.values()
+                if artifacts is None or pli["artifact"] in artifacts
+            )
+            applyPlan(plan, promptDelete=None, autoDeleteOld=True, keepHistory=False)
+        except FileNotFoundError as e:
+            # Picked up by the next prune, once the index has dropped it
+            print(f"Skipped pruning {self.folder}, {e.filename} vanished")
+            return
+        for action in plan:
+            for older in action["delete"]:
+                self.items.pop(older["path"], None)
+
+
+def getPluginDb(
+    plPath: pathlib.PosixPath,
+    promptDelete: None | Callable[[PluginItem, PluginItem], None],
+    autoDeleteOld: bool,
+) -> dict[str, PluginItem]:
+    plugindb, plan = planPluginDb(plPath)
+    applyPlan(plan, promptDelete, autoDeleteOld)
     return plugindb
 
 
@@ -79,7 +223,7 @@ def testVersion(
 ) -> list[str]:
     errors = []
     assert plPath.is_dir()
-    for path, artifact, ymlVersion in index_plugins(plPath):
+    for path, artifact, ymlVersion, _ in index_plugins(plPath):
         try:
             print(path, artifact, ymlVersion)
             print("Parsed successfully", CustomVersion(ymlVersion))
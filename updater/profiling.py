@@ -0,0 +1,302 @@
+"""Opt-in sampling profiler shared by every updater entry point.
+
+Enabled with --profile[=DIR] on any script or UPDATER_PROFILE=DIR in the
+environment. Each run writes to DIR:
+
+- NAME.folded: collapsed stacks for flamegraph.pl or speedscope
+- NAME.pstats: the same samples as pstats data, for pstats or snakeviz
+- NAME.txt: timed hot functions and asyncio tasks
+"""
+
+import asyncio
+import collections.abc
+import contextlib
+import inspect
+import marshal
+import os
+import pathlib
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from types import FrameType
+from typing import Any
+
+ENV_VAR = "UPDATER_PROFILE"
+DEFAULT_DIR = pathlib.PosixPath("~/.cache/updater-profiles").expanduser()
+SAMPLE_INTERVAL = 0.005
+
+# Hot paths timed exactly rather than sampled: (module, class, function)
+TIMED = (
+    ("versions", "CustomVersion", "_parse"),
+    ("index_plugins", None, "read_plugin_yml"),
+    ("plLib", None, "firstMoreRecent"),
+)
+
+FrameKey = tuple[str, int, str]
+
+
+def _key(frame: FrameType) -> FrameKey:
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _label(key: FrameKey) -> str:
+    filename, line, name = key
+    return f"{name} ({pathlib.PurePath(filename).name}:{line})"
+
+
+class _TimedCoro(collections.abc.Coroutine):
+    """Coroutine adding the time spent in each of its steps to stats[3]."""
+
+    def __init__(self, coro: collections.abc.Coroutine, stats: list[float]) -> None:
+        self.coro = coro
+        self.stats = stats
+        self.__qualname__ = getattr(coro, "__qualname__", type(coro).__name__)
+
+    def _step(self, method: Callable, *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.stats[3] += time.perf_counter() - start
+
+    def send(self, value: Any) -> Any:
+        return self._step(self.coro.send, value)
+
+    def throw(self, *args: Any) -> Any:
+        return self._step(self.coro.throw, *args)
+
+    def close(self) -> None:
+        self.coro.close()
+
+    def __await__(self) -> "_TimedCoro":
+        return self
+
+    def __iter__(self) -> "_TimedCoro":
+        return self
+
+    def __next__(self) -> Any:
+        return self.send(None)
+
+
+class Profiler:
+    """Wall-clock stack sampler with exact timers and asyncio task timing."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.stacks: Counter[tuple[FrameKey, ...]] = Counter()
+        self.timers: dict[str, list[float]] = defaultdict(lambda: [0, 0.0])
+        self.tasks: dict[str, list[float]] = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.restore: list[Callable[[], None]] = []
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_key(frame))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def _timed(self, name: str, func: Callable) -> Callable:
+        timer = self.timers[name]
+        lock = self.lock
+
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with lock:
+                    timer[0] += 1
+                    timer[1] += elapsed
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def _patch(self) -> None:
+        """Wrap TIMED functions everywhere they were imported by name."""
+        for moduleName, className, funcName in TIMED:
+            module = _module(moduleName)
+            if module is None:
+                continue
+
+            if className is not None:
+                cls = getattr(module, className)
+                func = cls.__dict__[funcName]
+                setattr(cls, funcName, self._timed(f"{className}.{funcName}", func))
+                self.restore.append(lambda c=cls, n=funcName, f=func: setattr(c, n, f))
+                continue
+
+            func = getattr(module, funcName)
+            wrapper = self._timed(funcName, func)
+            for other in list(sys.modules.values()):
+                if getattr(other, funcName, None) is func:
+                    setattr(other, funcName, wrapper)
+                    self.restore.append(
+                        lambda m=other, n=funcName, f=func: setattr(m, n, f),
+                    )
+
+    def _taskFactory(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        coro: Any,
+        **kwargs: Any,
+    ) -> asyncio.Task:
+        """Create a task timing its wall time and the steps it runs."""
+        stats = self.tasks[getattr(coro, "__qualname__", type(coro).__name__)]
+        if inspect.iscoroutine(coro):
+            coro = _TimedCoro(coro, stats)
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        start = time.perf_counter()
+
+        def done(task: asyncio.Task) -> None:
+            stats[0] += 1
+            elapsed = time.perf_counter() - start
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+        task.add_done_callback(done)
+        return task
+
+    def newLoop(self) -> asyncio.AbstractEventLoop:
+        """Event loop whose tasks are timed."""
+        loop = asyncio.new_event_loop()
+        loop.set_task_factory(self._taskFactory)
+        return loop
+
+    def start(self) -> None:
+        self._patch()
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        self.stopped.set()
+        self.thread.join()
+        for restore in self.restore:
+            restore()
+
+    def _pstats(self) -> dict:
+        """Samples in the pstats layout, call counts being sample counts."""
+        stats: dict[FrameKey, list] = {}
+        for stack, count in self.stacks.items():
+            seconds = count * self.interval
+            for i, key in enumerate(stack):
+                entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                # Recursive frames count once per sample
+                if key not in stack[:i]:
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if i == len(stack) - 1:
+                    entry[2] += seconds
+                if i:
+                    caller = entry[4].get(stack[i - 1], (0, 0, 0.0, 0.0))
+                    own = seconds if i == len(stack) - 1 else 0.0
+                    entry[4][stack[i - 1]] = (
+                        caller[0] + count,
+                        caller[1] + count,
+                        caller[2] + own,
+                        caller[3] + seconds,
+                    )
+
+        return {key: tuple(entry) for key, entry in stats.items()}
+
+    def _summary(self) -> str:
+        samples = sum(self.stacks.values())
+        lines = [
+            f"Wall time {self.elapsed:.3f}s, {samples} samples every {self.interval * 1000:g}ms",
+            "",
+            "Timed functions: calls, total seconds, mean milliseconds",
+        ]
+        for name, (calls, total) in sorted(self.timers.items()):
+            mean = total / calls * 1000 if calls else 0
+            lines.append(f"  {name}: {calls} {total:.4f} {mean:.3f}")
+
+        lines += [
+            "",
+            "Asyncio tasks: count, total wall seconds, max wall seconds, busy seconds",
+        ]
+        byTotal = sorted(self.tasks.items(), key=lambda item: -item[1][1])
+        for name, (count, total, longest, busy) in byTotal:
+            lines.append(
+                f"  {name}: {count} {total:.3f} {longest:.3f} {busy:.3f}",
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: pathlib.PosixPath, name: str) -> pathlib.PosixPath:
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = directory / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+        with stem.with_suffix(".folded").open("w", encoding="utf-8") as f:
+            for stack, count in self.stacks.items():
+                f.write(";".join(_label(key) for key in stack) + f" {count}\n")
+        with stem.with_suffix(".pstats").open("wb") as f:
+            marshal.dump(self._pstats(), f)
+        stem.with_suffix(".txt").write_text(self._summary(), encoding="utf-8")
+        return stem
+
+
+def _module(name: str) -> Any:
+    """Loaded module called name, including the script run as __main__."""
+    module = sys.modules.get(name)
+    main = sys.modules.get("__main__")
+    if module is None and main is not None:
+        path = getattr(main, "__file__", None)
+        module = main if path and pathlib.PurePath(path).stem == name else None
+    return module
+
+
+def _profileDir() -> pathlib.PosixPath | None:
+    """Take --profile[=DIR] off the command line, falling back to the env var."""
+    for i, arg in enumerate(sys.argv[1:], start=1):
+        if arg == "--profile" or arg.startswith("--profile="):
+            del sys.argv[i]
+            value = arg.partition("=")[2] or os.environ.get(ENV_VAR) or DEFAULT_DIR
+            # Downloaders started from here are profiled too
+            os.environ[ENV_VAR] = str(pathlib.PosixPath(value).expanduser().resolve())
+            break
+
+    value = os.environ.get(ENV_VAR)
+    return pathlib.PosixPath(value).expanduser().resolve() if value else None
+
+
+def _call(main: Callable[[], Any], profiler: Profiler | None = None) -> None:
+    result = main()
+    if not inspect.iscoroutine(result):
+        return
+
+    loopFactory = None if profiler is None else profiler.newLoop
+    with asyncio.Runner(loop_factory=loopFactory) as runner:
+        runner.run(result)
+
+
+def run(main: Callable[[], Any]) -> None:
+    """Run a script's main, sync or async, profiled when asked to."""
+    directory = _profileDir()
+    if directory is None:
+        _call(main)
+        return
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        _call(main, profiler)
+    finally:
+        profiler.stop()
+        stem = profiler.write(directory, pathlib.PurePath(sys.argv[0]).stem)
+        with contextlib.suppress(BrokenPipeError):
+            print(f"Profile written to {stem}.*", file=sys.stderr)
@@ -2,7 +2,8 @@
 import argparse
 import pathlib
 
-from plLib import getPluginDb
+import profiling
+from plLib import applyPlan, planPluginDb, printPlan
 
 
 def parseArgs() -> argparse.Namespace:
@@ -27,8 +28,14 @@ def parseArgs() -> argparse.Namespace:
 
 def main() -> None:
     args = parseArgs()
-    getPluginDb(args.tar.resolve(), promptDelete=None, autoDeleteOld=not args.n)
+    _, plan = planPluginDb(args.tar.resolve())
+    if args.n:
+        printPlan(plan)
+    else:
+        # Only server folders are rolled back, databases are pulled again
+        keepHistory = args.tar.name == "plugins"
+        applyPlan(plan, promptDelete=None, autoDeleteOld=True, keepHistory=keepHistory)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
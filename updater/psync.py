@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
 import logging
 import pathlib
 import subprocess
 from collections.abc import Generator
 from datetime import datetime
 
+import profiling
+from depGraph import affectedBy, buildGraph, groupUpdates
+from history import defaultHistory, fileDigest
 from lib.types.logevents import PluginUpdate
-from plLib import PluginItem, firstMoreRecent, getPluginDb
+from mirror import DEFAULT_CACHE, pullMirror
+from plLib import FolderIndex, PluginItem, firstMoreRecent, getPluginDb, retire
+from updateServerJar import retire_server_jar
 
 psync_logger = logging.getLogger(__name__)
 
@@ -24,16 +30,25 @@ def parseArgs() -> argparse.Namespace:
 
     parser.add_argument(
         "--src",
-        type=pathlib.PosixPath,
-        required=True,
-        help="Path to the source directory.",
+        help="Path to the source directory, or URL of a mirrored database.",
     )
     parser.add_argument(
         "--tar",
         type=pathlib.PosixPath,
-        required=True,
         help="Path to the target directory.",
     )
+    parser.add_argument(
+        "--rollback",
+        metavar="ARTIFACT",
+        help="Restore the previous copy of a plugin or server jar from the local "
+        "history, in --tar or in every server it was replaced on.",
+    )
+    parser.add_argument(
+        "--cache",
+        type=pathlib.PosixPath,
+        default=DEFAULT_CACHE,
+        help="Local copy of mirrored databases.",
+    )
     parser.add_argument(
         "-n",
         action="store_true",
@@ -45,7 +60,11 @@ def parseArgs() -> argparse.Namespace:
         help="Confirm operation without prompting.",
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.rollback is None and (args.src is None or args.tar is None):
+        parser.error("--src and --tar are required unless rolling back.")
+
+    return args
 
 
 def promptDelete(older: PluginItem, newer: PluginItem) -> None:
@@ -59,7 +78,7 @@ def promptDelete(older: PluginItem, newer: PluginItem) -> None:
         newer["path"].name + "? (y/n)",
     )
     if input().lower().startswith("y"):
-        older["path"].unlink()
+        retire(older)
 
 
 def validateArgs(src: pathlib.PosixPath, tar: pathlib.PosixPath) -> None:
@@ -76,19 +95,26 @@ def validateArgs(src: pathlib.PosixPath, tar: pathlib.PosixPath) -> None:
 
 
 DeltaGen = Generator[tuple[PluginItem, PluginItem]]
+PluginDb = dict[str, PluginItem]
 
 
-def getDelta(
+def getPluginDbs(
     src: pathlib.PosixPath,
     tar: pathlib.PosixPath,
     autoyes: bool,
-    skip_major: bool = True,
-) -> DeltaGen:
+) -> tuple[PluginDb, PluginDb]:
     prompt = None if autoyes else promptDelete
 
     srcdb = getPluginDb(src, promptDelete=prompt, autoDeleteOld=False)
     tardb = getPluginDb(tar, promptDelete=prompt, autoDeleteOld=False)
+    return srcdb, tardb
+
 
+def getDelta(
+    srcdb: PluginDb,
+    tardb: PluginDb,
+    skip_major: bool = True,
+) -> DeltaGen:
     for artifact, srcPlugin in srcdb.items():
         if artifact not in tardb:
             continue
@@ -104,88 +130,223 @@ def getDelta(
         yield srcPlugin, tardb[artifact]
 
 
-def updatePlugins(
+UpdateGroup = list[tuple[PluginItem, PluginItem]]
+
+
+def groupDelta(
+    srcdb: PluginDb,
+    tardb: PluginDb,
     deltaGen: DeltaGen,
+) -> list[tuple[UpdateGroup, set[str]]]:
+    """Group updates so dependent plugins are replaced together.
+
+    Each group comes with the installed artifacts it transitively affects.
+    """
+    delta = {
+        srcPlugin["artifact"]: (srcPlugin, tarPlugin)
+        for srcPlugin, tarPlugin in deltaGen
+    }
+    # New versions may declare new dependencies
+    graph = buildGraph(tardb | {artifact: srcdb[artifact] for artifact in delta})
+
+    return [
+        ([delta[artifact] for artifact in group], affectedBy(graph, group))
+        for group in groupUpdates(graph, delta)
+    ]
+
+
+def _describe(plugins: UpdateGroup) -> str:
+    return ", ".join(tarPlugin["path"].stem for _, tarPlugin in plugins)
+
+
+def _stage(srcPlugin: PluginItem, tarPlugin: PluginItem) -> pathlib.PosixPath:
+    """Copy a new plugin next to the one it replaces, under a hidden name."""
+    dest = tarPlugin["path"].parent / srcPlugin["path"].name
+    tmp = dest.with_name(f".{dest.name}.psync")
+    subprocess.run(
+        (
+            "cp",
+            "--reflink=auto",
+            "--preserve=timestamps",
+            str(srcPlugin["path"]),
+            str(tmp),
+        ),
+        check=True,
+    )
+    return tmp
+
+
+def replaceGroup(plugins: UpdateGroup) -> list[PluginUpdate]:
+    """Replace every plugin of a group, or none if any copy fails."""
+    staged: list[pathlib.PosixPath] = []
+    try:
+        for srcPlugin, tarPlugin in plugins:
+            staged.append(_stage(srcPlugin, tarPlugin))
+    except (OSError, subprocess.CalledProcessError):
+        for tmp in staged:
+            tmp.unlink(missing_ok=True)
+        print(f"Failed to update plugins {_describe(plugins)}")
+        return []
+
+    updates: list[PluginUpdate] = []
+    for (srcPlugin, tarPlugin), tmp in zip(plugins, staged, strict=True):
+        print(
+            "Replaced",
+            tarPlugin["path"].stem,
+            str(tarPlugin["version"]),
+            "with",
+            str(srcPlugin["version"]),
+        )
+        try:
+            oldTime = mtimeToDateString(tarPlugin["path"].stat().st_mtime)
+        except FileNotFoundError:
+            oldTime = None
+
+        retire(tarPlugin)
+        tmp.replace(tmp.with_name(srcPlugin["path"].name))
+
+        oldVersion = str(tarPlugin["version"])
+        newVersion = str(srcPlugin["version"])
+
+        if oldVersion == newVersion:
+            if oldTime is not None:
+                oldVersion += " " + oldTime
+            newVersion += " " + mtimeToDateString(srcPlugin["path"].stat().st_mtime)
+
+        updates.append(
+            {
+                "name": tarPlugin["path"].stem,
+                "newVersion": newVersion,
+                "oldVersion": oldVersion,
+            },
+        )
+
+    return updates
+
+
+def updatePlugins(
+    groups: list[tuple[UpdateGroup, set[str]]],
     dryrun: bool,
     autoyes: bool,
 ) -> tuple[PluginUpdate, ...]:
     updates: list[PluginUpdate] = []
-    for srcPlugin, tarPlugin in deltaGen:
+    for plugins, affected in groups:
+        if len(plugins) > 1:
+            print("Dependent plugins updated together:", _describe(plugins))
+        if affected:
+            print("Also affects:", ", ".join(sorted(affected)))
+
         if dryrun:
-            print(
-                "Would replace",
-                tarPlugin["path"].stem,
-                str(tarPlugin["version"]),
-                "with",
-                str(srcPlugin["version"]),
-            )
+            for srcPlugin, tarPlugin in plugins:
+                print(
+                    "Would replace",
+                    tarPlugin["path"].stem,
+                    str(tarPlugin["version"]),
+                    "with",
+                    str(srcPlugin["version"]),
+                )
             continue
 
         if not autoyes:
-            print(
-                "Replace",
-                tarPlugin["path"].stem,
-                str(tarPlugin["version"]),
-                "with",
-                str(srcPlugin["version"]) + "? (y/n)",
-            )
+            for srcPlugin, tarPlugin in plugins:
+                print(
+                    "Replace",
+                    tarPlugin["path"].stem,
+                    str(tarPlugin["version"]),
+                    "with",
+                    str(srcPlugin["version"]),
+                )
+            print("Proceed? (y/n)")
             if not input().lower().startswith("y"):
-                print("Skipping", tarPlugin["path"].stem)
+                print("Skipping", _describe(plugins))
                 continue
 
-        print(
-            "Replaced",
-            tarPlugin["path"].stem,
-            str(tarPlugin["version"]),
-            "with",
-            str(srcPlugin["version"]),
-        )
-        try:
-            try:
-                oldTime = mtimeToDateString(tarPlugin["path"].stat().st_mtime)
-            except FileNotFoundError:
-                oldTime = None
-
-            tarPlugin["path"].unlink()
-            dest = str(tarPlugin["path"].parent / srcPlugin["path"].name)
-            subprocess.run(
-                (
-                    "cp",
-                    "--reflink=auto",
-                    "--preserve=timestamps",
-                    str(srcPlugin["path"]),
-                    dest,
-                ),
-                check=True,
-            )
-        except Exception:
-            print(f"Failed to update plugin {tarPlugin['path'].stem}")
-        else:
-            oldVersion = str(tarPlugin["version"])
-            newVersion = str(srcPlugin["version"])
-
-            if oldVersion == newVersion:
-                if oldTime is not None:
-                    oldVersion += " " + oldTime
-                newVersion += " " + mtimeToDateString(srcPlugin["path"].stat().st_mtime)
-
-            updates.append(
-                {
-                    "name": tarPlugin["path"].stem,
-                    "newVersion": newVersion,
-                    "oldVersion": oldVersion,
-                },
-            )
+        updates += replaceGroup(plugins)
 
     return tuple(updates)
 
 
+SERVER_TYPES = ("paper", "velocity")
+
+
+def _matches(pli: PluginItem, artifact: str) -> bool:
+    return artifact.lower() in (pli["artifact"].lower(), pli["deps"]["name"].lower())
+
+
+def rollback(
+    artifact: str,
+    tar: pathlib.PosixPath | None,
+    dryrun: bool,
+) -> int:
+    """Swap installed copies of artifact for the ones they replaced, offline.
+
+    The swapped out copies go into the history too, marked so that rolling
+    back again goes back another version instead of returning to them.
+    """
+    history = defaultHistory()
+    server = artifact in SERVER_TYPES
+    if tar is not None:
+        folders = [tar]
+    else:
+        # Staging folders are pruned too, only restore into servers
+        folders = [
+            f
+            for f in history.folders(artifact)
+            if f.is_dir() and (server or f.name == "plugins")
+        ]
+
+    restored = 0
+    for folder in folders:
+        plugins = (
+            []
+            if server
+            else [
+                p for p in FolderIndex(folder).items.values() if _matches(p, artifact)
+            ]
+        )
+        installed = (
+            sorted(folder.glob(f"{artifact}-*-*.jar"))
+            if server
+            else [pli["path"] for pli in plugins]
+        )
+
+        entry = history.previous(folder, artifact, {fileDigest(p) for p in installed})
+        if entry is None:
+            print(f"No earlier copy of {artifact} in {folder}")
+            continue
+
+        if dryrun:
+            print(f"Would restore {entry['file']} {entry['version']} in {folder}")
+            continue
+
+        for pli in plugins:
+            retire(pli, rolledBack=True)
+        if server:
+            for jar in installed:
+                retire_server_jar(artifact, jar, rolledBack=True)
+        history.restore(entry)
+        print(f"Restored {entry['file']} {entry['version']} in {folder}")
+        restored += 1
+
+    return restored
+
+
 def main() -> None:
     args = parseArgs()
-    src = args.src.resolve()
+    if args.rollback is not None:
+        tar = None if args.tar is None else args.tar.resolve()
+        rollback(args.rollback, tar, args.n)
+        return
+
+    if args.src.startswith(("http://", "https://")):
+        src = asyncio.run(pullMirror(args.src, args.cache.expanduser()))
+    else:
+        src = pathlib.PosixPath(args.src).resolve()
     target = args.tar.resolve()
     validateArgs(src, target)
-    updates = updatePlugins(getDelta(src, target, args.y), args.n, args.y)
+    srcdb, tardb = getPluginDbs(src, target, args.y)
+    groups = groupDelta(srcdb, tardb, getDelta(srcdb, tardb))
+    updates = updatePlugins(groups, args.n, args.y)
 
     if updates:
         print(f"Completed {len(updates)} plugin updates for {target.parent.name}.")
@@ -195,4 +356,4 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
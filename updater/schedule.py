@@ -0,0 +1,41 @@
+import time
+
+from stateDb import StateDb
+
+# Plugins seen changing are checked every run, dormant ones back off to this
+MIN_INTERVAL = 60 * 60
+MAX_INTERVAL = 7 * 24 * 60 * 60
+
+
+class Schedule:
+    """Per-plugin next-check times with exponential backoff while unchanged."""
+
+    def __init__(self, db: StateDb, force: bool = False) -> None:
+        self.db = db
+        self.force = force
+        self.now = time.time()
+        self.skipped = 0
+
+    def due(self, source: str, key: str) -> bool:
+        entry = self.db.plugin(source, key)
+        if self.force or entry is None or entry["next"] is None:
+            return True
+        if entry["next"] <= self.now:
+            return True
+
+        self.skipped += 1
+        return False
+
+    def record(self, source: str, key: str, observed: str) -> None:
+        """Store the upstream marker, e.g. date, build or Last-Modified."""
+        entry = self.db.plugin(source, key)
+        if entry is None or entry["observed"] != observed:
+            self.db.setSchedule(source, key, observed, self.now, self.now, 0)
+            return
+
+        interval = min(MAX_INTERVAL, max(MIN_INTERVAL, entry["interval"] * 2))
+        self.db.setSchedule(source, key, observed, entry["changed"], self.now, interval)
+
+    def report(self) -> None:
+        if self.skipped:
+            print(f"Skipped {self.skipped} plugins not due for a check.")
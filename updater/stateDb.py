@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import pathlib
+import sqlite3
+
+# Plain-text plugin lists, still accepted as configuration
+CONFIG_FILES = {
+    "jenkins": "jenkins.txt",
+    "modrinth": "modrinth.csv",
+    "spiget": "spiget.csv",
+}
+
+# Seconds a write waits for another process holding the database lock
+BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plugins (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    enabled INTEGER NOT NULL DEFAULT 1,
+    version TEXT NOT NULL DEFAULT '',
+    observed TEXT,
+    changed REAL,
+    checked REAL,
+    interval REAL,
+    next REAL,
+    PRIMARY KEY (source, key)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS redirects (
+    url TEXT PRIMARY KEY,
+    final TEXT NOT NULL,
+    location TEXT NOT NULL,
+    etag TEXT NOT NULL,
+    checked REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS modrinth_ids (
+    slug TEXT PRIMARY KEY,
+    id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    retry REAL NOT NULL
+);
+"""
+
+
+def _readConfig(source: str, text: str) -> list[tuple[str, str, str]]:
+    """Key, name and version of each entry of a plugin list file."""
+    lines = [i.strip() for i in text.splitlines() if i.strip()]
+    if source == "jenkins":
+        return [(url, "", "") for url in lines]
+
+    rows = [i.split(",") for i in lines if i.count(",") == 1]
+    if source == "spiget":
+        return [(rid, name, "") for name, rid in rows]
+    return [(slug, "", date) for slug, date in rows]
+
+
+def _writeConfig(source: str, rows: list[sqlite3.Row]) -> str:
+    if source == "jenkins":
+        lines = [r["key"] for r in rows]
+    elif source == "spiget":
+        lines = [f"{r['name']},{r['key']}" for r in rows]
+    else:
+        lines = [f"{r['key']},{r['version']}" for r in rows]
+    return "".join(f"{line}\n" for line in lines)
+
+
+class StateDb:
+    """Per-target SQLite store of plugin sources and download state.
+
+    Every write commits on its own so an interrupted run keeps the
+    progress made so far.
+    """
+
+    def __init__(self, folder: pathlib.Path) -> None:
+        self.folder = folder
+        # Downloaders of one target share the store, wait for each other's writes
+        self.conn = sqlite3.connect(folder / "state.db", timeout=BUSY_TIMEOUT)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def importConfig(self, source: str) -> bool:
+        """Sync the plugin list file into the store, False if there is none.
+
+        New entries are added, entries no longer listed are disabled and
+        the state of existing ones is kept.
+        """
+        path = self.folder / CONFIG_FILES[source]
+        try:
+            entries = _readConfig(source, path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return False
+
+        with self.conn:
+            self.conn.execute(
+                "UPDATE plugins SET enabled = 0 WHERE source = ?",
+                (source,),
+            )
+            self.conn.executemany(
+                """INSERT INTO plugins (source, key, name, version) VALUES (?, ?, ?, ?)
+                ON CONFLICT (source, key) DO UPDATE SET name = excluded.name, enabled = 1""",
+                [(source, *entry) for entry in entries],
+            )
+        return True
+
+    def exportConfig(self, source: str) -> None:
+        path = self.folder / CONFIG_FILES[source]
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(_writeConfig(source, self.plugins(source)), encoding="utf-8")
+        tmp.replace(path)
+
+    def plugins(self, source: str) -> list[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM plugins WHERE source = ? AND enabled ORDER BY rowid",
+            (source,),
+        ).fetchall()
+
+    def plugin(self, source: str, key: str) -> sqlite3.Row | None:
+        return self.conn.execute(
+            "SELECT * FROM plugins WHERE source = ? AND key = ?",
+            (source, key),
+        ).fetchone()
+
+    def setVersion(self, source: str, key: str, version: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE plugins SET version = ? WHERE source = ? AND key = ?",
+                (version, source, key),
+            )
+
+    def setSchedule(
+        self,
+        source: str,
+        key: str,
+        observed: str,
+        changed: float,
+        checked: float,
+        interval: float,
+    ) -> None:
+        with self.conn:
+            self.conn.execute(
+                """INSERT INTO plugins (source, key, observed, changed, checked, interval, next)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source, key) DO UPDATE SET
+                    observed = excluded.observed, changed = excluded.changed,
+                    checked = excluded.checked, interval = excluded.interval,
+                    next = excluded.next""",
+                (source, key, observed, changed, checked, interval, checked + interval),
+            )
+
+    def recordFile(
+        self,
+        path: pathlib.Path,
+        source: str,
+        key: str,
+        url: str,
+    ) -> None:
+        with path.open("rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (path.name, source, key, url, digest, path.stat().st_mtime),
+            )
+
+    def redirect(self, url: str) -> sqlite3.Row | None:
+        return self.conn.execute(
+            "SELECT * FROM redirects WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+    def setRedirect(
+        self,
+        url: str,
+        final: str,
+        location: str,
+        etag: str,
+        checked: float,
+    ) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO redirects VALUES (?, ?, ?, ?, ?)",
+                (url, final, location, etag, checked),
+            )
+
+    def dropRedirect(self, url: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM redirects WHERE url = ?", (url,))
+
+    def projectId(self, slug: str) -> str | None:
+        row = self.conn.execute(
+            "SELECT id FROM modrinth_ids WHERE slug = ?",
+            (slug,),
+        ).fetchone()
+        return None if row is None else row["id"]
+
+    def setProjectId(self, slug: str, projectId: str) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO modrinth_ids VALUES (?, ?)",
+                (slug, projectId),
+            )
+
+    def host(self, host: str) -> sqlite3.Row | None:
+        return self.conn.execute(
+            "SELECT * FROM hosts WHERE host = ?",
+            (host,),
+        ).fetchone()
+
+    def setHost(self, host: str, failures: int, retry: float) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hosts VALUES (?, ?, ?)",
+                (host, failures, retry),
+            )
+
+    def clearHost(self, host: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM hosts WHERE host = ?", (host,))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Import or export plugin lists of a target's state store.",
+    )
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument(
+        "--tar",
+        type=pathlib.PosixPath,
+        required=True,
+        help="Path to the target directory.",
+    )
+    args = parser.parse_args()
+
+    db = StateDb(args.tar.resolve())
+    for source, filename in CONFIG_FILES.items():
+        if args.action == "export":
+            if db.plugins(source):
+                db.exportConfig(source)
+                print(f"Exported {filename}")
+        elif db.importConfig(source):
+            print(f"Imported {filename}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,33 @@
 #!/usr/bin/env python3
 import argparse
+import json
+import os
 import pathlib
+import re
+import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 
+import profiling
 import requests
+from breaker import (
+    CircuitBreaker,
+    budget,
+    hostFailed,
+    hostOf,
+    requestsTimeout,
+    wgetArgs,
+)
+from history import defaultHistory
+from stateDb import StateDb
 
 USER_AGENT = "server-updater (discord.gg/JrhYskAFtA)"
 BASE_API_URL = "https://fill.papermc.io/v3/projects"
+API_HOST = hostOf(BASE_API_URL)
+METADATA_TTL = 10 * 60
 
 session = requests.Session()
 session.headers.update({"User-Agent": USER_AGENT})
@@ -20,9 +39,22 @@ class PaperMCAPIError(Exception):
     """Custom exception for PaperMC API errors."""
 
 
-def get_latest_stable_build(serverType: ServerType, version: str) -> dict[str, str]:
-    """Get the latest stable build information."""
-    response = session.get(f"{BASE_API_URL}/{serverType}/versions/{version}/builds")
+def get_builds(
+    serverType: ServerType,
+    version: str,
+    cache: pathlib.PosixPath | None = None,
+) -> list[dict]:
+    """Get the build list, reusing a recent copy from the cache folder."""
+    if cache is not None:
+        meta = cache / f"{serverType}-{version}-builds.json"
+        if meta.is_file() and time.time() - meta.stat().st_mtime < METADATA_TTL:
+            return json.loads(meta.read_text())
+
+    response = session.get(
+        f"{BASE_API_URL}/{serverType}/versions/{version}/builds",
+        timeout=requestsTimeout("papermc"),
+    )
+    response.raise_for_status()
 
     try:
         builds = response.json()
@@ -32,6 +64,20 @@ def get_latest_stable_build(serverType: ServerType, version: str) -> dict[str, s
             msg,
         ) from e
 
+    if cache is not None:
+        meta.write_text(json.dumps(builds))
+
+    return builds
+
+
+def get_latest_stable_build(
+    serverType: ServerType,
+    version: str,
+    cache: pathlib.PosixPath | None = None,
+) -> dict[str, str]:
+    """Get the latest stable build information."""
+    builds = get_builds(serverType, version, cache)
+
     # Find the first stable build (builds are ordered newest first)
     stable_build = None
     for build in builds:
@@ -72,37 +118,80 @@ def download_server_jar(
 ) -> None:
     """Download the server jar file."""
     subprocess.run(
-        ["wget", "-O", filename, download_url],
+        ["wget", *wgetArgs("papermc"), "-O", filename, download_url],
         check=True,
         cwd=str(server_path),
+        timeout=budget("papermc").total,
     )
 
 
+def retire_server_jar(
+    serverType: ServerType,
+    jar_file: pathlib.PosixPath,
+    rolledBack: bool = False,
+) -> None:
+    """Delete an old server jar, keeping it in the version history."""
+    version = jar_file.stem.removeprefix(f"{serverType}-")
+    defaultHistory().remove(jar_file, serverType, serverType, version, rolledBack)
+
+
+def remove_old_jars(
+    serverType: ServerType,
+    serverPath: pathlib.PosixPath,
+    filename: str,
+    keep_history: bool = True,
+    version: str | None = None,
+) -> bool:
+    """Remove old versions and check if we already have the latest.
+
+    With a version, only builds of exactly that version are touched.
+    """
+    found_current = False
+    for jar_file in serverPath.glob(f"{serverType}-*-*.jar"):
+        if version is not None and not re.fullmatch(
+            rf"{re.escape(serverType)}-{re.escape(version)}-\d+\.jar",
+            jar_file.name,
+        ):
+            continue
+        if jar_file.name == filename:
+            found_current = True
+        elif keep_history:
+            retire_server_jar(serverType, jar_file)
+        else:
+            jar_file.unlink()
+
+    return found_current
+
+
+def link_server_jar(jar: pathlib.PosixPath, serverPath: pathlib.PosixPath) -> None:
+    """Hardlink a cached jar into a server folder, copying across filesystems."""
+    dest = serverPath / jar.name
+    try:
+        os.link(jar, dest)
+    except OSError:
+        shutil.copy2(jar, dest)
+
+
 def update_server(
     serverType: ServerType,
     version: str,
     serverPath: pathlib.PosixPath,
+    breaker: CircuitBreaker,
 ) -> None:
     """Update server jar to the latest stable build."""
+    if not breaker.allow(API_HOST):
+        print(f"Skipped update, {API_HOST} keeps failing.")
+        sys.exit(1)
+
     try:
         # Get latest stable build information
         build_info = get_latest_stable_build(serverType, version)
+        breaker.record(API_HOST, None)
         latest_build = build_info["build"]
         filename = build_info["filename"]
         download_url = build_info["download_url"]
 
-        # Check existing jars
-        jars = list(serverPath.glob(f"{serverType}-*-*.jar"))
-
-        # Remove old versions and check if we already have the latest
-        found_current = False
-        for jar_file in jars:
-            if jar_file.name == filename:
-                found_current = True
-            else:
-                jar_file.unlink()
-
-        if found_current:
+        if remove_old_jars(serverType, serverPath, filename):
             print(f"No update for {serverType} {version} found.")
             return
 
@@ -116,13 +205,113 @@ def update_server(
         print(f"Error updating server: {e}")
         sys.exit(1)
     except requests.exceptions.RequestException as e:
+        breaker.record(API_HOST, e)
         print(f"Network error: {e}")
         sys.exit(1)
-    except subprocess.CalledProcessError as e:
+    except subprocess.SubprocessError as e:
         print(f"Download failed: {e}")
         sys.exit(1)
 
 
+def update_group(
+    serverType: ServerType,
+    version: str,
+    serverPaths: list[pathlib.PosixPath],
+    cache: pathlib.PosixPath,
+) -> None:
+    """Update every server on one type and version from a single download."""
+    build_info = get_latest_stable_build(serverType, version, cache)
+    latest_build = build_info["build"]
+    filename = build_info["filename"]
+
+    outdated = [p for p in serverPaths if not (p / filename).is_file()]
+    if not outdated:
+        for serverPath in serverPaths:
+            remove_old_jars(serverType, serverPath, filename)
+        print(f"No update for {serverType} {version} found.")
+        return
+
+    if not (cache / filename).is_file():
+        print(f"Downloading {serverType} {version} build {latest_build}...")
+        download_server_jar(build_info["download_url"], f"{filename}.part", cache)
+        (cache / f"{filename}.part").rename(cache / filename)
+    # The cache only holds copies of what servers run. Other versions of the
+    # same type are handled by concurrent groups, so leave their jars alone.
+    remove_old_jars(serverType, cache, filename, keep_history=False, version=version)
+
+    def install(serverPath: pathlib.PosixPath) -> None:
+        # Old jars go only once the new one is in place
+        if serverPath in outdated:
+            link_server_jar(cache / filename, serverPath)
+        remove_old_jars(serverType, serverPath, filename)
+
+    with ThreadPoolExecutor() as pool:
+        list(pool.map(install, serverPaths))
+
+    print(
+        f"Successfully updated {len(outdated)} {serverType} {version} servers to build {latest_build}",
+    )
+
+
+def update_fleet(
+    servers: list[tuple[ServerType, str, pathlib.PosixPath]],
+    cache: pathlib.PosixPath,
+    breaker: CircuitBreaker,
+) -> None:
+    """Update many servers, querying and downloading each type and version once."""
+    groups: dict[tuple[ServerType, str], list[pathlib.PosixPath]] = {}
+    for serverType, version, serverPath in servers:
+        groups.setdefault((serverType, version), []).append(serverPath)
+
+    if not breaker.allow(API_HOST):
+        print(f"Skipped update, {API_HOST} keeps failing.")
+        sys.exit(1)
+
+    def run(
+        group: tuple[tuple[ServerType, str], list[pathlib.PosixPath]],
+    ) -> Exception | None:
+        (serverType, version), paths = group
+        try:
+            update_group(serverType, version, paths, cache)
+        except PaperMCAPIError as e:
+            print(f"Error updating {serverType} {version}: {e}")
+            return e
+        except requests.exceptions.RequestException as e:
+            print(f"Network error for {serverType} {version}: {e}")
+            return e
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"Download failed for {serverType} {version}: {e}")
+            return e
+
+        return None
+
+    with ThreadPoolExecutor() as pool:
+        errors = list(pool.map(run, groups.items()))
+
+    # The state store stays on this thread, one outcome per run
+    breaker.record(API_HOST, next((e for e in errors if hostFailed(e)), None))
+    if any(errors):
+        sys.exit(1)
+
+
+def read_servers(
+    path: pathlib.PosixPath,
+) -> list[tuple[ServerType, str, pathlib.PosixPath]]:
+    """Read "type version path" lines."""
+    servers = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+
+        serverType, version, serverPath = line.split(maxsplit=2)
+        if serverType not in ("paper", "velocity"):
+            msg = f"Unknown server type {serverType} in {path}"
+            raise ValueError(msg)
+        servers.append((serverType, version, pathlib.PosixPath(serverPath).resolve()))
+
+    return servers
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Update server jars using Fill v3 API.",
@@ -131,19 +320,48 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "type",
         type=str,
+        nargs="?",
         choices=["paper", "velocity"],
         help="Type of server: paper or velocity",
     )
-    parser.add_argument("version", type=str, help="Server version")
-    parser.add_argument("path", type=pathlib.PosixPath, help="Path to server folder")
-    return parser.parse_args()
+    parser.add_argument("version", type=str, nargs="?", help="Server version")
+    parser.add_argument(
+        "path",
+        type=pathlib.PosixPath,
+        nargs="?",
+        help="Path to server folder",
+    )
+    parser.add_argument(
+        "--servers",
+        type=pathlib.PosixPath,
+        help='File with one "type version path" line per server to update.',
+    )
+    parser.add_argument(
+        "--cache",
+        type=pathlib.PosixPath,
+        default=pathlib.PosixPath.home() / ".cache" / "server-jars",
+        help="Shared folder for downloaded jars and build metadata.",
+    )
+    args = parser.parse_args()
+
+    if args.servers is None and args.path is None:
+        parser.error("Either type, version and path or --servers is required.")
+
+    return args
 
 
 def main() -> None:
     args = parse_args()
+    cache = args.cache.resolve()
+    cache.mkdir(parents=True, exist_ok=True)
+    breaker = CircuitBreaker(StateDb(cache), "papermc")
+
+    if args.servers is not None:
+        update_fleet(read_servers(args.servers), cache, breaker)
+        return
 
-    update_server(args.type, args.version, args.path.resolve())
+    update_server(args.type, args.version, args.path.resolve(), breaker)
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
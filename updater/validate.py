@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import contextlib
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import BadZipFile, ZipFile
+
+import profiling
+from index_plugins import (
+    DESCRIPTOR_ERRORS,
+    get_prop,
+    parse_descriptor,
+    read_plugin_yml,
+)
+
+QUARANTINE_DIR = "quarantine"
+
+# A file written this recently may still be downloading
+SETTLE_SECONDS = 30
+
+
+def checkJar(jar_file: str) -> str | None:
+    """Why a JAR is unusable, None if it is a readable plugin.
+
+    Checks the zip structure, the CRC of every member and that the plugin
+    descriptor parses. Runs in worker processes.
+    """
+    try:
+        with ZipFile(jar_file) as zip_ref:
+            bad = zip_ref.testzip()
+        if bad is not None:
+            return f"CRC mismatch in {bad}"
+
+        text, is_yml = read_plugin_yml(pathlib.PosixPath(jar_file))
+        doc = parse_descriptor(text, is_yml)
+        get_prop(doc, "main")
+        get_prop(doc, "version")
+    except BadZipFile as e:
+        return f"Not a zip archive: {e}"
+    except FileNotFoundError:
+        return "No plugin descriptor"
+    except KeyError as e:
+        return f"Descriptor misses {e}"
+    except DESCRIPTOR_ERRORS as e:
+        return f"Descriptor does not parse: {e}"
+
+    return None
+
+
+def quarantine(jar_file: pathlib.PosixPath, reason: str) -> None:
+    """Move a bad JAR out of the folder so it is never indexed."""
+    dest = jar_file.parent / QUARANTINE_DIR
+    dest.mkdir(exist_ok=True)
+    jar_file.replace(dest / jar_file.name)
+    print(f"Quarantined {jar_file}: {reason}")
+
+
+class Validator:
+    """Validates JARs in a process pool, remembering unchanged good files."""
+
+    def __init__(self) -> None:
+        self.pool = ProcessPoolExecutor()
+        self.valid: dict[pathlib.PosixPath, tuple[int, int]] = {}
+        # Bad files left alone because they may still be written to
+        self.unsettled: set[pathlib.PosixPath] = set()
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    async def check(self, jar_file: pathlib.PosixPath, settled: bool = False) -> bool:
+        """True if usable. Bad files are quarantined once no longer written."""
+        self.unsettled.discard(jar_file)
+        try:
+            st = jar_file.stat()
+        except FileNotFoundError:
+            return False
+
+        if self.valid.get(jar_file) == (st.st_size, st.st_mtime_ns):
+            return True
+
+        loop = asyncio.get_running_loop()
+        reason = await loop.run_in_executor(self.pool, checkJar, str(jar_file))
+        if reason is None:
+            self.valid[jar_file] = (st.st_size, st.st_mtime_ns)
+            return True
+
+        with contextlib.suppress(FileNotFoundError):
+            if settled or time.time() - jar_file.stat().st_mtime > SETTLE_SECONDS:
+                quarantine(jar_file, reason)
+            else:
+                self.unsettled.add(jar_file)
+        return False
+
+    async def checkAll(
+        self,
+        jar_files: list[pathlib.PosixPath],
+        settled: bool = False,
+    ) -> list[pathlib.PosixPath]:
+        """The usable files among jar_files, checked in parallel."""
+        ok = await asyncio.gather(*(self.check(j, settled) for j in jar_files))
+        return [j for j, good in zip(jar_files, ok, strict=True) if good]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Quarantine truncated or invalid plugin JARs.",
+    )
+    parser.add_argument(
+        "--tar",
+        type=pathlib.PosixPath,
+        required=True,
+        help="Path to the target directory.",
+    )
+    folder = parser.parse_args().tar.resolve()
+
+    validator = Validator()
+    jars = sorted(folder.glob("*jar"))
+    good = await validator.checkAll(jars, settled=True)
+    validator.close()
+    print(f"{len(good)} of {len(jars)} JARs are valid.")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
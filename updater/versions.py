@@ -78,6 +78,10 @@ class CustomVersion:
             self.suffix.lower() if self.suffix else "",
         )
 
+    def sort_key(self) -> tuple[Version, str]:
+        """Key ordering versions the same way as comparisons do."""
+        return self._comparison_key()
+
     def __eq__(self, other: object) -> bool:
         """Check equality with another CustomVersion."""
         if not isinstance(other, CustomVersion):
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import pathlib
+import re
+import sys
+
+import profiling
+from downloadLib import downloaderCommands
+from history import defaultHistory
+from plLib import FolderIndex
+from psync import getDelta, groupDelta, updatePlugins, validateArgs
+from validate import QUARANTINE_DIR, SETTLE_SECONDS, Validator
+from watchfiles import Change, awatch
+
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 24 * 60 * 60
+
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Keep the plugin database and servers updated as files change.",
+    )
+
+    parser.add_argument(
+        "--staging",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("DIR", "LOADER"),
+        help="Staging directory downloaded into, and its modrinth loader.",
+    )
+    parser.add_argument(
+        "--url",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("URL", "DEST"),
+        help="Direct URL downloaded with oget.",
+    )
+    parser.add_argument(
+        "--mirror",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("SRC", "DEST"),
+        help="Mirror a pruned staging directory into the final database.",
+    )
+    parser.add_argument(
+        "--server",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("SRC", "PLUGINS"),
+        help="Sync plugins from a database into a server plugins folder.",
+    )
+
+    return parser.parse_args()
+
+
+class Source:
+    """A downloader run on an interval adapted to how often it finds updates."""
+
+    def __init__(self, args: tuple[str, ...], folders: list[pathlib.PosixPath]) -> None:
+        self.args = args
+        self.folders = folders
+        self.interval = MIN_INTERVAL
+
+    def _snapshot(self) -> set[tuple[str, int]]:
+        return {
+            (str(p), p.stat().st_mtime_ns)
+            for folder in self.folders
+            for p in folder.glob("*jar")
+        }
+
+    async def run(self, lock: asyncio.Lock) -> None:
+        while True:
+            async with lock:
+                before = self._snapshot()
+                p = await asyncio.create_subprocess_exec(sys.executable, *self.args)
+                await p.communicate()
+                changed = self._snapshot() != before
+
+            if changed:
+                self.interval = max(MIN_INTERVAL, self.interval // 2)
+            else:
+                self.interval = min(MAX_INTERVAL, self.interval * 2)
+
+            await asyncio.sleep(self.interval)
+
+
+def getSources(args: argparse.Namespace) -> list[Source]:
+    staging = [(pathlib.PosixPath(d).resolve(), loader) for d, loader in args.staging]
+    urls = [(url, pathlib.PosixPath(dest).resolve()) for url, dest in args.url]
+    return [Source(*command) for command in downloaderCommands(staging, urls)]
+
+
+def _rsyncPattern(name: str) -> str:
+    return "/" + re.sub(r"([*?\[\\])", r"\\\1", name)
+
+
+async def mirror(
+    src: pathlib.PosixPath,
+    dest: pathlib.PosixPath,
+    skip: set[pathlib.PosixPath],
+) -> None:
+    """rsync a staging folder, leaving out partial, unsettled and bad files."""
+    excludes = ["--exclude", "state.db*", "--exclude", f"{QUARANTINE_DIR}/"]
+    excludes += ["--exclude", "*.part"]
+    for path in sorted(skip):
+        if path.parent == src:
+            excludes += ["--exclude", _rsyncPattern(path.name)]
+
+    p = await asyncio.create_subprocess_exec(
+        "rsync", "-a", "--delete", *excludes, f"{src}/", f"{dest}/"
+    )
+    await p.communicate()
+
+
+class Daemon:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.staging = {pathlib.PosixPath(d).resolve() for d, _ in args.staging}
+        self.staging |= {pathlib.PosixPath(d).resolve().parent for _, d in args.url}
+        self.mirrors = [
+            (pathlib.PosixPath(s).resolve(), pathlib.PosixPath(d).resolve())
+            for s, d in args.mirror
+        ]
+        self.servers = [
+            (pathlib.PosixPath(s).resolve(), pathlib.PosixPath(d).resolve())
+            for s, d in args.server
+        ]
+
+        self.folders = self.staging | {
+            f for pair in self.mirrors + self.servers for f in pair
+        }
+        for src, tar in self.servers:
+            validateArgs(src, tar)
+
+        self.indexes: dict[pathlib.PosixPath, FolderIndex] = {}
+        self.sources = getSources(args)
+        self.validator = Validator()
+        # Reactions touch the indexes from worker threads, one at a time
+        self.lock = asyncio.Lock()
+        self.pending: set[asyncio.Task] = set()
+
+    def sync(self, src: pathlib.PosixPath, tar: pathlib.PosixPath) -> None:
+        srcdb = self.indexes[src].db()
+        tardb = self.indexes[tar].db()
+        groups = groupDelta(srcdb, tardb, getDelta(srcdb, tardb))
+        updates = updatePlugins(groups, dryrun=False, autoyes=True)
+
+        # Don't wait for the watcher to see our own replacements
+        for group, _ in groups:
+            for srcPlugin, tarPlugin in group:
+                self.indexes[tar].update(tarPlugin["path"])
+                self.indexes[tar].update(tar / srcPlugin["path"].name)
+
+        if updates:
+            print(f"Completed {len(updates)} plugin updates for {tar.parent.name}.")
+            # The daemon never exits, trim what each sync stored
+            defaultHistory().trim()
+
+    async def react(self, touched: set[pathlib.PosixPath]) -> None:
+        """Prune, mirror and push whatever the touched folders feed into.
+
+        Called with the lock held.
+        """
+        for folder in touched & self.staging:
+            await asyncio.to_thread(self.indexes[folder].prune)
+
+        for src, dest in self.mirrors:
+            if src in touched:
+                await mirror(src, dest, self.validator.unsettled)
+
+        for src, tar in self.servers:
+            if src in touched:
+                await asyncio.to_thread(self.sync, src, tar)
+
+    async def handle(self, changes: set[tuple[Change, str]]) -> None:
+        async with self.lock:
+            touched = set()
+            for change, name in changes:
+                path = pathlib.PosixPath(name)
+                if path.parent not in self.indexes or not path.name.endswith("jar"):
+                    continue
+
+                index = self.indexes[path.parent]
+                if change == Change.deleted and path not in index.items:
+                    continue
+                # Bad or unfinished downloads must not reach the servers
+                if (
+                    change != Change.deleted
+                    and path.parent in self.staging
+                    and not await self.validator.check(path)
+                ):
+                    index.items.pop(path, None)
+                    if path in self.validator.unsettled:
+                        self.pending.add(asyncio.create_task(self.settle(path)))
+                    continue
+
+                await asyncio.to_thread(index.update, path)
+                touched.add(path.parent)
+
+            if touched:
+                await self.react(touched)
+
+    async def settle(self, path: pathlib.PosixPath) -> None:
+        """Look at a bad file again once it can no longer be a download."""
+        await asyncio.sleep(SETTLE_SECONDS)
+        if path in self.validator.unsettled:
+            await self.handle({(Change.modified, str(path))})
+
+    async def run(self) -> None:
+        # Downloaders share folders, run one at a time to attribute changes
+        lock = asyncio.Lock()
+
+        # Nothing is downloading yet, quarantine leftovers of earlier runs
+        for folder in self.staging:
+            await self.validator.checkAll(sorted(folder.glob("*jar")), settled=True)
+        self.indexes = {folder: FolderIndex(folder) for folder in self.folders}
+
+        tasks = [asyncio.create_task(source.run(lock)) for source in self.sources]
+
+        async with self.lock:
+            await self.react(set(self.indexes))
+        async for changes in awatch(*self.indexes):
+            await self.handle(changes)
+            self.pending = {task for task in self.pending if not task.done()}
+
+        for task in tasks + list(self.pending):
+            task.cancel()
+        self.validator.close()
+
+
+async def main() -> None:
+    await Daemon(parseArgs()).run()
+
+
+if __name__ == "__main__":
+    profiling.run(main)